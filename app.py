@@ -1,17 +1,23 @@
-import json
-
 from flask import Flask
 from dotenv import load_dotenv
 import os
+import signal
+import threading
 from getmac import get_mac_address
 
-from parking_spot.interfaces.services import parking_spot_api
+from parking_spot.application.services import ParkingSpotApplicationService
+from parking_spot.interfaces.event_stream import SpotEventStreamServer
+from parking_spot.interfaces.services import parking_spot_api, set_stream_server_port
 from iam.interfaces.services import iam_api
 from device.interfaces.services import device_api
+from shared.interfaces.services import metrics_api
 from shared.infrastructure.backend_connector import BackendApiClient
-from shared.infrastructure.database import init_db
+from shared.infrastructure.database import init_db, close_db, db
+from parking_spot.infrastructure.repositories import ParkingSpotRepository
+from parking_spot.infrastructure.write_behind import spot_status_writer
+from parking_spot.infrastructure.history import transition_log
 from shared.infrastructure.mqtt_client import mqtt_client_device, mqtt_client_cloud, on_device_status_update, \
-    on_device_provisioning_request, on_cloud_provisioning_response
+    on_device_provisioning_request, on_cloud_provisioning_response, spot_key, cloud_uplink
 
 load_dotenv()
 
@@ -30,6 +36,7 @@ app = Flask(__name__)
 app.register_blueprint(iam_api)
 app.register_blueprint(parking_spot_api)
 app.register_blueprint(device_api)
+app.register_blueprint(metrics_api)
 
 mqtt_initialized = False
 
@@ -53,7 +60,7 @@ def initialize_mqtt():
             print(f"✓ Suscrito a provisioning topic '{provisioning_topic}': {provisioning_subscribe}")
 
         provision_request = { "mac": mac_address.lower() }
-        mqtt_client_cloud.publish(os.getenv("MQTT_CLOUD_TOPIC_PROVISIONING_REQUEST"), json.dumps(provision_request), qos=1)
+        mqtt_client_cloud.publish(os.getenv("MQTT_CLOUD_TOPIC_PROVISIONING_REQUEST"), provision_request, qos=1)
 
     else:
         print("✗ Error conectando a MQTT broker para el backend")
@@ -65,7 +72,7 @@ def initialize_mqtt():
         provisioning_topic = os.getenv("MQTT_DEVICE_TOPIC_PROVISIONING_REQUEST")
 
         if estado_topic:
-            estado_subscribe = mqtt_client_device.subscribe(estado_topic, callback=on_device_status_update)
+            estado_subscribe = mqtt_client_device.subscribe(estado_topic, callback=on_device_status_update, key=spot_key)
             print(f"✓ Suscrito a reserva topic '{estado_topic}': {estado_subscribe}")
 
         if provisioning_topic:
@@ -76,17 +83,115 @@ def initialize_mqtt():
     else:
         print("✗ Error conectando a MQTT broker")
 
-@app.before_request
-def setup():
-    init_db()
+# Flask handles each request on a short-lived thread: hand its connection back to the pool when done
+app.teardown_request(close_db)
+
+services_started = False
+services_stopped = False
+_lifecycle_lock = threading.RLock()
+
+
+def start_services():
+    """Prepara la base de datos, la caché y los hilos de fondo, y conecta MQTT. Solo una vez por proceso."""
+    global services_started
+
+    with _lifecycle_lock:
+        if services_started:
+            return
+        init_db()
+        ParkingSpotRepository.warm_cache()
+        ParkingSpotRepository.reconcile_occupancy()
+        ParkingSpotRepository.start_occupancy_reconciler(int(os.getenv("OCCUPANCY_RECONCILE_SECONDS", "300")))
+        ParkingSpotRepository.start_history_maintenance(int(os.getenv("HISTORY_ROLLUP_SECONDS", "60")))
+        initialize_mqtt()
+        services_started = True
+
+
+def stop_services(timeout: float = None):
+    """
+    Apaga todo en orden una vez que el servidor HTTP dejó de atender peticiones:
+    primero deja de recibir y termina los mensajes MQTT en curso, luego envía lo
+    pendiente a la nube y a los dispositivos, guarda los cambios en la base de
+    datos y por último la cierra.
+    """
+    global services_stopped
+
+    if timeout is None:
+        timeout = float(os.getenv("SHUTDOWN_TIMEOUT_SECONDS", "5"))
+    with _lifecycle_lock:
+        if services_stopped:
+            return
+        services_stopped = True
+
+        # Streams end on their own once the hub is closed
+        ParkingSpotRepository.get_event_hub().close()
+        print("Terminando mensajes MQTT en curso...")
+        mqtt_client_device.drain(timeout)
+        mqtt_client_cloud.drain(timeout)
+        print("Enviando estados pendientes a la nube...")
+        cloud_uplink.stop(timeout)
+        print("Desconectando MQTT...")
+        mqtt_client_device.disconnect(timeout)
+        mqtt_client_cloud.disconnect(timeout)
+        print("Guardando cambios de estado pendientes...")
+        ParkingSpotRepository.stop_occupancy_reconciler()
+        spot_status_writer.stop(timeout)
+        transition_log.stop(timeout)
+        db.close_all()
+
+
+def serve():
+    """Atiende HTTP con waitress (varios hilos, keep-alive) hasta recibir SIGINT o SIGTERM"""
+    from waitress import create_server
+
+    # Event streams are served from their own port by one asyncio loop, so they don't tie up the HTTP threads
+    stream_server = SpotEventStreamServer(
+        ParkingSpotApplicationService(),
+        host=os.getenv("SPOT_EVENTS_HOST", os.getenv("HTTP_HOST", "127.0.0.1")),
+        port=int(os.getenv("SPOT_EVENTS_PORT", "5001")),
+        heartbeat=int(os.getenv("SPOT_EVENTS_HEARTBEAT", "15")),
+    )
+    stream_server.start()
+    set_stream_server_port(stream_server.port)
+    hub = ParkingSpotRepository.get_event_hub()
+
+    server = create_server(
+        app,
+        host=os.getenv("HTTP_HOST", "127.0.0.1"),
+        port=int(os.getenv("HTTP_PORT", "5000")),
+        threads=int(os.getenv("HTTP_THREADS", "8")),
+        # Idle keep-alive connections are closed after this many seconds
+        channel_timeout=int(os.getenv("HTTP_KEEPALIVE_SECONDS", "30")),
+        connection_limit=int(os.getenv("HTTP_CONNECTION_LIMIT", "100")),
+        backlog=int(os.getenv("HTTP_BACKLOG", "1024")),
+        ident="smart-parking-edge",
+    )
+
+    def request_shutdown(signum, frame):
+        # Closing the hub ends every open event stream
+        hub.close()
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+
+    server.print_listen("Servidor HTTP escuchando en http://{}:{}")
+    print(f"Eventos de plazas en http://{stream_server.host}:{stream_server.port}/parking-spots/stream")
+    # On SystemExit waitress stops accepting and waits for the requests in progress
+    try:
+        server.run()
+    finally:
+        server.close()
+        stream_server.stop(float(os.getenv("SHUTDOWN_TIMEOUT_SECONDS", "5")))
+    print("Servidor HTTP detenido")
 
 
 if __name__ == '__main__':
-    initialize_mqtt()
-
+    start_services()
     try:
-        app.run(debug=True, use_reloader=False)
+        if os.getenv("SERVER_MODE", "production") == "development":
+            app.run(debug=True, use_reloader=False)
+        else:
+            serve()
     finally:
-        print("Desconectando MQTT...")
-        mqtt_client_device.disconnect()
-        mqtt_client_cloud.disconnect()
\ No newline at end of file
+        stop_services()
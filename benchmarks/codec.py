@@ -0,0 +1,114 @@
+"""
+Microbenchmark for the MQTT payload path, without a broker or handlers.
+
+Compares, per message, the way payloads used to be handled with the codec path
+used by MQTTClient now:
+
+    legacy   bytes.decode -> json.loads on receive; json.dumps -> str on publish,
+             with the payload formatted into an INFO log line either way
+    codec    JsonCodec.decode straight from bytes; JsonCodec.encode to bytes,
+             with lazy DEBUG logging (the message is never formatted)
+
+Each is measured for the status update a sensor sends and the status message the
+edge publishes to the cloud. The codec path is run with the stdlib json backend
+and, when it is installed, with orjson.
+
+Usage:
+    python benchmarks/codec.py --iterations 200000 --output codec_results.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.infrastructure.codec import JsonCodec, orjson  # noqa: E402
+
+TOPIC = "bench/parking/status"
+INBOUND = json.dumps({"spotId": "A1-017", "apiKey": "bench-api-key", "occupied": True}).encode()
+OUTBOUND = {"spotId": "A1-017", "apiKey": "bench-api-key", "occupied": True, "edgeServerId": "bench-edge"}
+
+logger = logging.getLogger("bench.codec")
+logger.setLevel(logging.WARNING)
+logger.addHandler(logging.NullHandler())
+
+
+def legacy_receive(payload: bytes):
+    text = payload.decode('utf-8')
+    logger.info(f"Mensaje recibido en '{TOPIC}': {text}")
+    return json.loads(text)
+
+
+def legacy_publish(message: dict):
+    payload = json.dumps(message)
+    logger.info(f"Mensaje publicado en '{TOPIC}': {payload}")
+    return payload
+
+
+def codec_paths(codec: JsonCodec):
+    def receive(payload: bytes):
+        logger.debug("Mensaje recibido en '%s': %r", TOPIC, payload)
+        return codec.decode(payload)
+
+    def publish(message: dict):
+        payload = codec.encode(message)
+        logger.debug("Mensaje publicado en '%s': %r", TOPIC, payload)
+        return payload
+
+    return receive, publish
+
+
+def measure(function, argument, iterations: int, repeat: int) -> float:
+    """Best of ``repeat`` runs, in microseconds per call"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function(argument)
+        best = min(best, time.perf_counter() - started)
+    return best / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    variants = {"legacy": (legacy_receive, legacy_publish), "codec[json]": codec_paths(JsonCodec(use_orjson=False))}
+    if orjson is not None:
+        variants["codec[orjson]"] = codec_paths(JsonCodec())
+
+    results = {}
+    for name, (receive, publish) in variants.items():
+        decode_us = measure(receive, INBOUND, args.iterations, args.repeat)
+        encode_us = measure(publish, OUTBOUND, args.iterations, args.repeat)
+        results[name] = {"decode_us": round(decode_us, 3), "encode_us": round(encode_us, 3),
+                         "total_us": round(decode_us + encode_us, 3)}
+
+    baseline = results["legacy"]["total_us"]
+    print(f"{'variant':<16}{'decode µs':>12}{'encode µs':>12}{'total µs':>12}{'speedup':>10}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['decode_us']:>12.3f}{result['encode_us']:>12.3f}{result['total_us']:>12.3f}"
+              f"{baseline / result['total_us']:>9.2f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "iterations": args.iterations,
+                "repeat": args.repeat,
+                "results": results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+End-to-end load benchmark for the MQTT message pipeline.
+
+Drives the real MQTTClient instances and handlers (on_device_status_update,
+on_cloud_status_update, on_device_provisioning_request) through a fake paho
+transport, against a throwaway SQLite database. Latency is measured from the
+moment a message is handed to the client (as paho's network thread would)
+until the resulting publish reaches the transport:
+
+    status        sensor reading       -> status publish to the cloud
+    reservation   cloud status update  -> reservation publish to the devices
+    provisioning  device request       -> provisioning response
+
+Usage:
+    python benchmarks/mqtt_load.py --spots 500 --rate 2000 --duration 10 --output results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATUS_TOPIC = "bench/parking/status"
+RESERVATION_TOPIC = "bench/parking/reserva"
+DEVICE_PROVISIONING_TOPIC = "bench/parking/provisioning"
+CLOUD_PARKING_PREFIX = "bench/cloud/parking/"
+PROVISIONING_RESPONSE_TOPIC = "provisioning/response"
+
+EDGE_ID = "bench-edge"
+API_KEY = "bench-api-key"
+PARKING_ID = 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spots", type=int, default=500, help="parking spots / sensors to simulate")
+    parser.add_argument("--rate", type=float, default=2000, help="messages per second (0 = as fast as possible)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load to generate")
+    parser.add_argument("--shape", choices=("steady", "burst", "ramp"), default="steady",
+                        help="steady rate, bursts of --burst-size back-to-back messages, or a linear ramp up to --rate")
+    parser.add_argument("--burst-size", type=int, default=200)
+    parser.add_argument("--mix", default="status=0.9,reservation=0.08,provisioning=0.02",
+                        help="share of each message type")
+    parser.add_argument("--device-workers", type=int, default=None, help="overrides MQTT_DEVICE_WORKERS")
+    parser.add_argument("--cloud-workers", type=int, default=None, help="overrides MQTT_CLOUD_WORKERS")
+    parser.add_argument("--uplink-mode", choices=("per_message", "deltas", "snapshot"), default=None,
+                        help="overrides MQTT_CLOUD_UPLINK_MODE")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="seconds to wait for queued messages to be handled")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="mqtt_load_results.json", help="where to write the JSON results")
+    parser.add_argument("--verbose", action="store_true", help="keep the application's per-message output")
+    return parser.parse_args()
+
+
+def configure_environment(args, database_path):
+    # Must happen before the application modules are imported: they read their settings at import time
+    os.environ["DATABASE_PATH"] = database_path
+    os.environ["MQTT_DEVICE_PORT"] = "1883"
+    os.environ["MQTT_CLOUD_PORT"] = "1883"
+    os.environ["MQTT_DEVICE_TOPIC_ESTADO"] = STATUS_TOPIC
+    os.environ["MQTT_DEVICE_TOPIC_RESERVA"] = RESERVATION_TOPIC
+    os.environ["MQTT_DEVICE_TOPIC_PROVISIONING_REQUEST"] = DEVICE_PROVISIONING_TOPIC
+    os.environ["MQTT_CLOUD_TOPIC_PARKING"] = CLOUD_PARKING_PREFIX
+    if args.device_workers is not None:
+        os.environ["MQTT_DEVICE_WORKERS"] = str(args.device_workers)
+    if args.cloud_workers is not None:
+        os.environ["MQTT_CLOUD_WORKERS"] = str(args.cloud_workers)
+    if args.uplink_mode is not None:
+        os.environ["MQTT_CLOUD_UPLINK_MODE"] = args.uplink_mode
+    sys.path.insert(0, ROOT)
+
+
+class _PublishInfo:
+    rc = 0
+
+    def __init__(self, mid):
+        self.mid = mid
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return True
+
+
+class FakePahoClient:
+    """Stands in for ``paho.mqtt.client.Client``: accepts every publish and records when it happened"""
+
+    def __init__(self, mqtt_client, published):
+        self.on_connect = mqtt_client._on_connect
+        self.on_disconnect = mqtt_client._on_disconnect
+        self.on_message = mqtt_client._on_message
+        self._published = published
+        self._mid = 0
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def tls_set(self, *args, **kwargs):
+        pass
+
+    def reconnect_delay_set(self, *args, **kwargs):
+        pass
+
+    def connect(self, host, port=1883, keepalive=60):
+        return 0
+
+    def loop_start(self):
+        self.on_connect(self, None, {}, 0)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.on_disconnect(self, None, 0)
+
+    def subscribe(self, topic, qos=0):
+        self._mid += 1
+        return 0, self._mid
+
+    def unsubscribe(self, topic):
+        self._mid += 1
+        return 0, self._mid
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        # list.append is atomic, so publishing workers don't need a lock here
+        self._published.append((time.perf_counter(), topic, payload))
+        return _PublishInfo(0)
+
+    def deliver(self, topic, payload):
+        import paho.mqtt.client as mqtt
+        message = mqtt.MQTTMessage(topic=topic.encode("utf-8"))
+        message.payload = payload
+        self.on_message(self, None, message)
+
+
+def parse_mix(mix):
+    shares = {}
+    for part in mix.split(","):
+        name, _, share = part.partition("=")
+        if name not in ("status", "reservation", "provisioning"):
+            raise SystemExit(f"Unknown message type in --mix: {name}")
+        shares[name] = float(share)
+    total = sum(shares.values())
+    return {name: share / total for name, share in shares.items() if share > 0}
+
+
+def schedule(args, count):
+    """Send offsets in seconds from the start of the run, one per message"""
+    if args.rate <= 0:
+        return [0.0] * count
+    if args.shape == "steady":
+        return [index / args.rate for index in range(count)]
+    if args.shape == "burst":
+        period = args.burst_size / args.rate
+        return [(index // args.burst_size) * period for index in range(count)]
+    # ramp: the rate grows linearly from 0 to --rate, so message n is sent at sqrt(2n * duration / rate)
+    return [(2 * index * args.duration / args.rate) ** 0.5 for index in range(count)]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, sent, started, finished):
+    latencies.sort()
+    elapsed = finished - started if finished and started else 0
+    ms = [value * 1000 for value in latencies]
+    return {
+        "sent": sent,
+        "completed": len(latencies),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(ms) / len(ms), 3) if ms else None,
+            "p50": _round(percentile(ms, 0.50)),
+            "p99": _round(percentile(ms, 0.99)),
+            "p999": _round(percentile(ms, 0.999)),
+            "max": _round(ms[-1] if ms else None),
+        },
+    }
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="mqtt-bench-")
+    configure_environment(args, os.path.join(workdir, "bench.db"))
+
+    from shared.infrastructure.database import init_db, close_db
+    from parking_spot.infrastructure.repositories import ParkingSpotRepository
+    from parking_spot.infrastructure.write_behind import spot_status_writer
+    from parking_spot.infrastructure.history import transition_log
+    from shared.infrastructure import mqtt_client as pipeline
+
+    import logging
+    if not args.verbose:
+        logging.getLogger(pipeline.__name__).setLevel(logging.WARNING)
+
+    published = []
+    device = FakePahoClient(pipeline.mqtt_client_device, published)
+    cloud = FakePahoClient(pipeline.mqtt_client_cloud, published)
+    pipeline.mqtt_client_device.client = device
+    pipeline.mqtt_client_cloud.client = cloud
+
+    rng = random.Random(args.seed)
+    spot_ids = [f"bench-spot-{index:05d}" for index in range(args.spots)]
+    macs = [f"02:00:{index >> 16 & 0xff:02x}:{index >> 8 & 0xff:02x}:{index & 0xff:02x}:00"
+            for index in range(args.spots)]
+    mix = parse_mix(args.mix)
+    count = int(args.rate * args.duration) if args.rate > 0 else int(2000 * args.duration)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        init_db()
+        ParkingSpotRepository.warm_cache()
+        pipeline.mqtt_client_cloud.connect()
+        pipeline.mqtt_client_device.connect()
+        pipeline.mqtt_client_device.subscribe(STATUS_TOPIC, callback=pipeline.on_device_status_update,
+                                              key=pipeline.spot_key)
+        pipeline.mqtt_client_device.subscribe(DEVICE_PROVISIONING_TOPIC,
+                                              callback=pipeline.on_device_provisioning_request)
+        pipeline.on_cloud_provisioning_response("bench/provisioning", {
+            "type": "config", "parkingId": PARKING_ID, "apiKey": API_KEY,
+            "serverId": EDGE_ID, "edgeName": "Benchmark edge",
+        })
+        pipeline.on_cloud_provisioning_response("bench/provisioning", {
+            "type": "devices",
+            "devices": [{
+                "macAddress": mac, "deviceType": "DISTANCE_SENSOR", "status": "AVAILABLE",
+                "spotLabel": f"B{index}", "spotId": spot_id, "parkingId": PARKING_ID, "edgeId": EDGE_ID,
+            } for index, (spot_id, mac) in enumerate(zip(spot_ids, macs))],
+        })
+    published.clear()
+
+    cloud_status_topic = pipeline.status_topic + EDGE_ID
+    identity = pipeline.edge_service.get_edge_identity()
+
+    # Pre-build every message so the generator only has to hand them over
+    occupied = [False] * args.spots
+    reserved = [False] * args.spots
+    messages = []
+    for kind in kinds:
+        index = rng.randrange(args.spots)
+        if kind == "status":
+            occupied[index] = not occupied[index]
+            payload = json.dumps({"spotId": spot_ids[index], "apiKey": API_KEY, "occupied": occupied[index]})
+            messages.append((device, STATUS_TOPIC, payload.encode(), ("status", spot_ids[index])))
+        elif kind == "reservation":
+            reserved[index] = not reserved[index]
+            payload = json.dumps({"spotId": spot_ids[index], "apiKey": API_KEY, "reserved": reserved[index]})
+            messages.append((cloud, cloud_status_topic, payload.encode(), ("reservation", spot_ids[index])))
+        else:
+            payload = json.dumps({"mac": macs[index]})
+            messages.append((device, DEVICE_PROVISIONING_TOPIC, payload.encode(), ("provisioning", macs[index])))
+
+    offsets = schedule(args, len(messages))
+    sent = []
+    print(f"Sending {len(messages)} messages over {args.spots} spots ({args.shape}, rate={args.rate}/s)...")
+    with quiet:
+        started = time.perf_counter()
+        for (client, topic, payload, key), offset in zip(messages, offsets):
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sent.append((time.perf_counter(), key))
+            client.deliver(topic, payload)
+        generated = time.perf_counter()
+
+        # Let the workers finish, then give the uplink one more window to publish what they queued
+        pipeline.mqtt_client_device.disconnect()
+        if pipeline.mqtt_client_cloud.executor:
+            pipeline.mqtt_client_cloud.executor.stop(drain=True, timeout=args.drain_timeout)
+        pipeline.cloud_uplink.stop()
+        drained = time.perf_counter()
+
+        pipeline.mqtt_client_cloud.disconnect()
+        spot_status_writer.stop()
+        transition_log.stop()
+        close_db()
+
+    # Pair every publish with the oldest unanswered message for the same spot or device. A batched
+    # uplink message (deltas or snapshot) answers every earlier status message of the spots it carries.
+    waiting = defaultdict(deque)
+    for sent_at, key in sent:
+        waiting[key].append(sent_at)
+    latencies = defaultdict(list)
+    last_completion = defaultdict(float)
+
+    def complete(key, published_at, coalesced=False):
+        queue = waiting[key]
+        while queue and queue[0] <= published_at:
+            latencies[key[0]].append(published_at - queue.popleft())
+            last_completion[key[0]] = max(last_completion[key[0]], published_at)
+            if not coalesced:
+                break
+
+    for published_at, topic, payload in published:
+        data = json.loads(payload)
+        if topic == identity.status_topic:
+            if "changes" in data:
+                for change in data["changes"]:
+                    complete(("status", change["spotId"]), published_at, coalesced=True)
+            elif "spots" in data:
+                for spot_id in data["spots"]:
+                    complete(("status", spot_id), published_at, coalesced=True)
+            else:
+                complete(("status", data.get("spotId")), published_at)
+        elif topic == RESERVATION_TOPIC or topic.startswith(RESERVATION_TOPIC + "/"):
+            # Broadcast or per-device downlink
+            complete(("reservation", data.get("spotId")), published_at)
+        elif topic == PROVISIONING_RESPONSE_TOPIC:
+            complete(("provisioning", data.get("mac", "").lower()), published_at)
+
+    sent_by_kind = defaultdict(int)
+    for kind in kinds:
+        sent_by_kind[kind] += 1
+    all_latencies = [value for values in latencies.values() for value in values]
+    results = {
+        "benchmark": "mqtt_load",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {
+            "spots": args.spots, "rate": args.rate, "duration": args.duration, "shape": args.shape,
+            "burst_size": args.burst_size, "mix": mix, "seed": args.seed,
+            "device_workers": pipeline.mqtt_client_device.executor.workers
+            if pipeline.mqtt_client_device.executor else 0,
+            "cloud_workers": pipeline.mqtt_client_cloud.executor.workers
+            if pipeline.mqtt_client_cloud.executor else 0,
+            "uplink_mode": pipeline.cloud_uplink.mode,
+        },
+        "generation_s": round(generated - started, 3),
+        "total": summarize(all_latencies, len(messages), started, max(last_completion.values(), default=0)),
+        "by_type": {
+            kind: summarize(latencies[kind], sent_by_kind[kind], started, last_completion[kind])
+            for kind in mix
+        },
+        "unanswered": len(messages) - len(all_latencies),
+        "drain_s": round(drained - generated, 3),
+    }
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+
+    total = results["total"]
+    print(f"Completed {total['completed']}/{total['sent']} messages, "
+          f"{total['throughput_per_s']} msg/s, latency p50={total['latency_ms']['p50']}ms "
+          f"p99={total['latency_ms']['p99']}ms p999={total['latency_ms']['p999']}ms")
+    for kind, summary in results["by_type"].items():
+        print(f"  {kind:<13} {summary['completed']:>7}/{summary['sent']:<7} "
+              f"p50={summary['latency_ms']['p50']}ms p99={summary['latency_ms']['p99']}ms")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Decoder microbenchmark for sensor status messages: JSON against the binary frame.
+
+Decodes the status update a sensor sends, as the device MQTT client does,
+in each wire format and reports the time per message and the payload size:
+
+    json[stdlib]   the JSON message through json.loads
+    json[orjson]   the same message through the configured JsonCodec (json[json] without orjson);
+                   the baseline, since it is what the device client uses for JSON
+    binary         the 5-byte frame through WireCodec, with the handle -> spotId lookup
+                   read from a warmed SpotStateCache as in the device client
+
+Usage:
+    python benchmarks/wire.py --iterations 200000 --output wire_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.codec import measure  # noqa: E402
+from parking_spot.domain.entities import ParkingSpot  # noqa: E402
+from parking_spot.infrastructure.cache import SpotStateCache  # noqa: E402
+from shared.infrastructure.codec import json_codec  # noqa: E402
+from shared.infrastructure.wire import WireCodec, encode_status  # noqa: E402
+
+SPOTS = 500
+HANDLE = 317
+SPOT_ID = "3f2b8c1e-5a47-4d2e-9b1c-7e6f0a9d4c21"
+API_KEY = "a91c2e7f4b6d8e0f1a3c5b7d9e2f4a6c"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    cache = SpotStateCache()
+    cache.warm(ParkingSpot(spot_id=SPOT_ID if handle == HANDLE else f"spot-{handle}", handle=handle,
+                           wire_format="binary") for handle in range(1, SPOTS + 1))
+    json_payload = json.dumps({"spotId": SPOT_ID, "apiKey": API_KEY, "occupied": True}).encode()
+    binary_payload = encode_status(HANDLE, True)
+
+    variants = {
+        "json[stdlib]": (json.loads, json_payload),
+        f"json[{json_codec.backend}]": (json_codec.decode, json_payload),
+        "binary": (WireCodec(resolve_handle=cache.spot_id_for_handle).decode, binary_payload),
+    }
+
+    results = {}
+    for name, (decode, payload) in variants.items():
+        assert decode(payload)["spotId"] == SPOT_ID
+        results[name] = {"decode_us": round(measure(decode, payload, args.iterations, args.repeat), 3),
+                         "payload_bytes": len(payload)}
+
+    baseline = results[f"json[{json_codec.backend}]"]
+    print(f"{'variant':<16}{'decode µs':>12}{'speedup':>10}{'bytes':>8}{'smaller':>10}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['decode_us']:>12.3f}{baseline['decode_us'] / result['decode_us']:>9.2f}x"
+              f"{result['payload_bytes']:>8}{baseline['payload_bytes'] / result['payload_bytes']:>9.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "iterations": args.iterations,
+                "repeat": args.repeat,
+                "results": results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
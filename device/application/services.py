@@ -1,5 +1,6 @@
 from iam.infrastructure.repositories import EdgeServerRepository
 from parking_spot.infrastructure.repositories import ParkingSpotRepository
+from shared.infrastructure.wire import BINARY, JSON, WIRE_FORMATS
 
 
 class DeviceService:
@@ -7,28 +8,59 @@ class DeviceService:
         self.repository = ParkingSpotRepository()
         self.edgeRepository = EdgeServerRepository
 
-    def provision_device(self, mac_address: str):
+    def provision_device(self, mac_address: str, encoding: str = None):
+        """
+        ``encoding`` is the payload format the device asks for ("json" or "binary"); devices
+        that don't say keep the one they have, and unknown formats fall back to JSON.
+        Binary devices get their spot handle.
+        """
+        if encoding and encoding not in WIRE_FORMATS:
+            encoding = JSON
         spot = self.repository.get_by_mac(mac_address)
         edge = self.edgeRepository.get_edger_server()
         if spot:
-            return {
+            if encoding and encoding != spot.wire_format:
+                spot = self.repository.set_wire_format(spot.spot_id, encoding)
+            response = {
                 "mac": spot.mac_address.upper(),
                 "status": spot.status,
                 "apiKey": edge.api_key,
                 "spotId": spot.spot_id,
                 "label": spot.spot_label,
+                "encoding": spot.wire_format,
             }
+            if spot.wire_format == BINARY:
+                response["handle"] = spot.handle
+            return response
         return None
 
-    def update_device_status(self, spot_id: str, status: str):
-        spot = self.repository.get_by_id(spot_id)
-        if not spot:
-            raise ValueError("Parking spot not found")
+    def get_device(self, spot_id: str):
+        return self.repository.get_by_id(spot_id)
 
-        updated_spot = self.repository.update_spot_status(spot_id, status)
+    def update_device_status(self, spot_id: str, status: str, source: str = None):
+        # The status change is queued for write-behind; the row is persisted on the next flush
+        updated_spot = self.repository.update_spot_status(spot_id, status, source)
+        return self._device_status(updated_spot)
+
+    def update_devices_status(self, statuses, source: str = None):
+        """
+        Change the status of several spots at once, all or nothing.
+        Returns one result per spot and whether the change was applied.
+        """
+        updated_spots, missing = self.repository.update_spot_statuses(statuses, source)
+        if missing:
+            missing = set(missing)
+            return [{
+                "spot": spot_id,
+                "error": "Parking spot not found" if spot_id in missing else "Not applied: other spots in the batch failed",
+            } for spot_id in statuses], False
+        return [self._device_status(spot) for spot in updated_spots], True
+
+    @staticmethod
+    def _device_status(spot):
         return {
-            "mac": updated_spot.mac_address,
-            "status": updated_spot.status,
-            "spot": updated_spot.spot_id,
-            "label": updated_spot.spot_label,
+            "mac": spot.mac_address,
+            "status": spot.status,
+            "spot": spot.spot_id,
+            "label": spot.spot_label,
         }
\ No newline at end of file
@@ -0,0 +1,60 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+class _SpotOccupancy:
+    __slots__ = ('candidate', 'candidate_since', 'candidate_count')
+
+    def __init__(self):
+        self.candidate: Optional[str] = None
+        self.candidate_since = 0.0
+        self.candidate_count = 0
+
+
+class OccupancyFilter:
+    """Decides which sensor readings are real occupancy changes.
+
+    Readings are compared with the spot's current status as the caller last
+    stored it, so the filter keeps no committed state of its own: a write that
+    fails is retried on the next reading, and a status set by a reservation or
+    the API is what the next reading is compared against. A reading equal to
+    the current status is suppressed. A different one is only accepted once it
+    has been seen in ``debounce_samples`` consecutive readings spanning at
+    least ``debounce_ms`` milliseconds, which absorbs sensors flapping around a
+    threshold.
+
+    The window is only checked when a reading arrives: a change is accepted on
+    the first reading after the window has passed, so it relies on sensors
+    reporting periodically rather than only on change.
+    """
+
+    def __init__(self, debounce_ms: int = 0, debounce_samples: int = 1):
+        self.debounce = debounce_ms / 1000
+        self.debounce_samples = max(1, debounce_samples)
+        self._spots: Dict[str, _SpotOccupancy] = {}
+        self._lock = threading.Lock()
+
+    def accept(self, spot_id: str, status: str, current: str, now: Optional[float] = None) -> bool:
+        """Return True when ``status`` should replace the spot's ``current`` status and be forwarded"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._spots.get(spot_id)
+            if state is None:
+                state = _SpotOccupancy()
+                self._spots[spot_id] = state
+
+            if status == current:
+                state.candidate = None
+                return False
+
+            if status != state.candidate:
+                state.candidate = status
+                state.candidate_since = now
+                state.candidate_count = 0
+            state.candidate_count += 1
+
+            # The candidate is kept until a reading matches the stored status, so if
+            # the caller fails to store this one the next reading is accepted at once
+            return (state.candidate_count >= self.debounce_samples and
+                    now - state.candidate_since >= self.debounce)
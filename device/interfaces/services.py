@@ -1,15 +1,16 @@
-import json
 import os
 
 from dotenv import load_dotenv
 from flask import Blueprint, jsonify, request
 from device.application.services import DeviceService
-from shared.infrastructure.mqtt_client import mqtt_client_device
+from shared.infrastructure.mqtt_client import device_downlink
 
 load_dotenv()
 device_api = Blueprint('device_api', __name__)
 
 device_service = DeviceService()
+max_batch_reservations = int(os.getenv("RESERVATION_BATCH_MAX", "500"))
+
 @device_api.route('/reservate', methods=['POST'])
 def reservate_device():
     try:
@@ -20,14 +21,47 @@ def reservate_device():
         if not spot_id:
             return jsonify({'error': 'Missing required fields'}), 400
 
-        payload = {
-            'spotId': spot_id,
-            'apiKey': '',
-            'reserved': reserved
-        }
-
-        updated_spot = device_service.update_device_status(spot_id, 'RESERVED' if reserved else 'AVAILABLE')
-        mqtt_client_device.publish(os.getenv("MQTT_DEVICE_TOPIC_RESERVA"), json.dumps(payload), qos=1)
+        updated_spot = device_service.update_device_status(spot_id, 'RESERVED' if reserved else 'AVAILABLE', source='api')
+        device_downlink.send_reservation(spot_id, '', reserved)
         return jsonify(updated_spot), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@device_api.route('/reservate/batch', methods=['POST'])
+def reservate_devices():
+    """Reserve or release several spots at once: either every spot changes or none does"""
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        reservations = data.get('reservations')
+
+        if not isinstance(reservations, list) or not reservations:
+            return jsonify({'error': 'reservations must be a non-empty list'}), 400
+        if len(reservations) > max_batch_reservations:
+            return jsonify({'error': f'At most {max_batch_reservations} reservations per batch'}), 400
+
+        statuses = {}
+        for reservation in reservations:
+            if not isinstance(reservation, dict):
+                return jsonify({'error': 'Every reservation must be an object'}), 400
+            spot_id = reservation.get('spotId')
+            reserved = reservation.get('reserved', False)
+            if not spot_id or not isinstance(spot_id, str):
+                return jsonify({'error': 'Every reservation needs a spotId'}), 400
+            if not isinstance(reserved, bool):
+                return jsonify({'error': f'reserved must be true or false for spot {spot_id}'}), 400
+            if spot_id in statuses:
+                return jsonify({'error': f'Spot {spot_id} appears more than once'}), 400
+            statuses[spot_id] = 'RESERVED' if reserved else 'AVAILABLE'
+
+        results, applied = device_service.update_devices_status(statuses, source='api')
+        if not applied:
+            return jsonify({'error': 'Some parking spots were not found', 'results': results}), 404
+
+        device_downlink.send_reservations(
+            [(spot_id, status == 'RESERVED') for spot_id, status in statuses.items()])
+        return jsonify({'results': results}), 200
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
\ No newline at end of file
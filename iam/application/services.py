@@ -2,6 +2,7 @@ from typing import Optional
 
 from iam.domain.entities import EdgeServer
 from iam.domain.services import AuthService
+from iam.infrastructure.identity import EdgeIdentity
 from iam.infrastructure.repositories import EdgeServerRepository
 
 
@@ -20,5 +21,8 @@ class AuthApplicationService:
     def get_edge_server(self) -> Optional[EdgeServer]:
         return self.edge_server_repository.get_edger_server()
 
+    def get_edge_identity(self) -> Optional[EdgeIdentity]:
+        return self.edge_server_repository.get_identity()
+
     def get_edge_server_by_id_and_api_key(self, edge_id: str, api_key: str) -> Optional[EdgeServer]:
         return self.edge_server_repository.find_by_id_and_api_key(edge_id, api_key)
\ No newline at end of file
@@ -1,21 +1,28 @@
+from dataclasses import dataclass
 from enum import Enum
 from datetime import datetime
+from typing import Optional, Union
 
 class EdgeServerStatus(Enum):
     ACTIVE = "ACTIVE"
     INACTIVE = "INACTIVE"
     MAINTENANCE = "MAINTENANCE"
 
+@dataclass(frozen=True, slots=True)
 class EdgeServer:
-    def __init__(self, edge_id: str, parking_id: str, name: str = None,
-                 api_key: str = None, status: str = None,
-                 mac_address: str = None, last_sync: str = None,
-                 created_at: str = None):
-        self.edge_id = edge_id
-        self.parking_id = parking_id
-        self.name = name or f"EdgeServer-{edge_id}"
-        self.api_key = api_key
-        self.status = status
-        self.mac_address = mac_address
-        self.last_sync = last_sync or datetime.now().isoformat()
-        self.created_at = created_at or datetime.now().isoformat()
\ No newline at end of file
+    edge_id: str
+    parking_id: str
+    name: Optional[str] = None
+    api_key: Optional[str] = None
+    status: Optional[str] = None
+    mac_address: Optional[str] = None
+    last_sync: Union[datetime, str, None] = None
+    created_at: Union[datetime, str, None] = None
+
+    def __post_init__(self):
+        if not self.name:
+            object.__setattr__(self, 'name', f"EdgeServer-{self.edge_id}")
+        if self.last_sync is None:
+            object.__setattr__(self, 'last_sync', datetime.now())
+        if self.created_at is None:
+            object.__setattr__(self, 'created_at', datetime.now())
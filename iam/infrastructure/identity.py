@@ -0,0 +1,58 @@
+import os
+import threading
+from typing import Callable, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+from iam.domain.entities import EdgeServer
+
+load_dotenv()
+
+
+class EdgeIdentity(NamedTuple):
+    """Immutable snapshot of the local edge server and the topics derived from it"""
+    edge: EdgeServer
+    status_topic: str
+
+
+class EdgeIdentityHolder:
+    """Process-wide holder for the local edge identity.
+
+    The identity is loaded once and replaced as a whole, so readers on the MQTT
+    threads always see a consistent edge and topic pair without taking a lock.
+    """
+
+    def __init__(self, status_topic_prefix: str = ""):
+        self.status_topic_prefix = status_topic_prefix
+        self._identity: Optional[EdgeIdentity] = None
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> Optional[EdgeIdentity]:
+        return self._identity
+
+    def get_or_load(self, loader: Callable[[], Optional[EdgeServer]]) -> Optional[EdgeIdentity]:
+        identity = self._identity
+        if identity is not None:
+            return identity
+
+        with self._lock:
+            if self._identity is None:
+                edge = loader()
+                if edge is not None:
+                    self._identity = self._build(edge)
+            return self._identity
+
+    def set(self, edge: EdgeServer) -> EdgeIdentity:
+        identity = self._build(edge)
+        self._identity = identity
+        return identity
+
+    def clear(self):
+        self._identity = None
+
+    def _build(self, edge: EdgeServer) -> EdgeIdentity:
+        return EdgeIdentity(edge=edge, status_topic=f"{self.status_topic_prefix}{edge.edge_id}")
+
+
+edge_identity = EdgeIdentityHolder(os.getenv("MQTT_CLOUD_TOPIC_PARKING", ""))
@@ -4,11 +4,15 @@ from typing import Optional
 from getmac import get_mac_address
 
 from iam.domain.entities import EdgeServer, EdgeServerStatus
+from iam.infrastructure.identity import EdgeIdentity, edge_identity
 from iam.infrastructure.models import EdgeServer as EdgeServerModel
+from shared.infrastructure.mapper import RowMapper
+
+edge_mapper = RowMapper(EdgeServerModel, EdgeServer)
 
 
 class EdgeServerRepository:
-    
+
     @staticmethod
     def get_or_create_test_server(parking_id, edge_name, api_key, edge_id) -> Optional[EdgeServer]:
         """Get or create a test Edge Server for development purposes"""
@@ -24,16 +28,9 @@ class EdgeServerRepository:
                     'created_at': datetime.now()
                 }
             )
-            return EdgeServer(
-                edge_id=model.edge_id,
-                parking_id=model.parking_id,
-                name=model.name,
-                api_key=model.api_key,
-                status=model.status,
-                mac_address=model.mac_address,
-                last_sync=model.last_sync.isoformat(),
-                created_at=model.created_at.isoformat()
-            )
+            edge = edge_mapper.from_model(model)
+            edge_identity.set(edge)
+            return edge
         except Exception as e:
             print(f"Error getting or creating test edge server: {e}")
             return None
@@ -41,18 +38,19 @@ class EdgeServerRepository:
     @staticmethod
     def get_edger_server() -> Optional[EdgeServer]:
         """Get the Edge Server instance"""
+        identity = EdgeServerRepository.get_identity()
+        return identity.edge if identity else None
+
+    @staticmethod
+    def get_identity() -> Optional[EdgeIdentity]:
+        """Get the cached Edge Server identity, loading it from the database the first time"""
+        return edge_identity.get_or_load(EdgeServerRepository._load_edge_server)
+
+    @staticmethod
+    def _load_edge_server() -> Optional[EdgeServer]:
         try:
-            model = EdgeServerModel.get()
-            return EdgeServer(
-                edge_id=model.edge_id,
-                parking_id=model.parking_id,
-                name=model.name,
-                api_key=model.api_key,
-                status=model.status,
-                mac_address=model.mac_address,
-                last_sync=model.last_sync.isoformat(),
-                created_at=model.created_at.isoformat()
-            )
+            row = edge_mapper.select().first()
+            return edge_mapper.from_row(row) if row else None
         except Exception as e:
             print(f"Error getting edge server: {e}")
             return None
@@ -60,23 +58,15 @@ class EdgeServerRepository:
     @staticmethod
     def find_by_id_and_api_key(edge_id, api_key) -> Optional[EdgeServer]:
         """Search for an Edge Server by ID and API key"""
-        try:
-            model = EdgeServerModel.get(
-                (EdgeServerModel.edge_id == edge_id) &
-                (EdgeServerModel.api_key == api_key)
-            )
-            return EdgeServer(
-                edge_id=model.edge_id,
-                parking_id=model.parking_id,
-                name=model.name,
-                api_key=model.api_key,
-                status=model.status,
-                mac_address=model.mac_address,
-                last_sync=model.last_sync.isoformat(),
-                created_at=model.created_at.isoformat()
-            )
-        except EdgeServerModel.get().DoesNotExist:
-            return None
+        identity = edge_identity.current
+        if identity and identity.edge.edge_id == edge_id and identity.edge.api_key == api_key:
+            return identity.edge
+
+        row = edge_mapper.select().where(
+            (EdgeServerModel.edge_id == edge_id) &
+            (EdgeServerModel.api_key == api_key)
+        ).first()
+        return edge_mapper.from_row(row) if row else None
 
     @staticmethod
     def update_last_sync(edge_id, timestamp=None):
@@ -85,7 +75,9 @@ class EdgeServerRepository:
         EdgeServerModel.update(last_sync=timestamp).where(
             EdgeServerModel.edge_id == edge_id
         ).execute()
-        
+        # Reload the cached identity on next access so it picks up the new timestamp
+        edge_identity.clear()
+
     @staticmethod
     def get_local_ip():
         """Get the local IP address of the server"""
@@ -96,4 +88,4 @@ class EdgeServerRepository:
         except Exception as e:
             print(f"Error getting local IP address: {e}")
             mock_ip = "192.168.0.123"
-            return mock_ip
\ No newline at end of file
+            return mock_ip
@@ -22,7 +22,59 @@ class ParkingSpotApplicationService:
             edge_id=edge_id
         )
         # Save the parking spot to the repository
-        return self.parking_spot_repository.save(spot)
+        return self.parking_spot_repository.save(spot, source='provisioning')
+
+    def create_parking_spots(self, devices):
+        """Validate and upsert a list of devices from the cloud in one go.
+
+        Returns the saved spots and a list of ``{"spotId", "error"}`` for the devices that were rejected.
+        """
+        spots = []
+        failures = []
+        for device in devices:
+            spot = self.parking_spot_service.create_spot(
+                mac_address=device.get("macAddress"),
+                device_type=device.get("deviceType"),
+                spot_status=device.get("status"),
+                spot_label=device.get("spotLabel"),
+                spot_id=device.get("spotId"),
+                parking_id=device.get("parkingId"),
+                edge_id=device.get("edgeId")
+            )
+            try:
+                self.parking_spot_service.validate_spot(spot)
+            except ValueError as e:
+                failures.append({"spotId": spot.spot_id, "error": str(e)})
+                continue
+            spots.append(spot)
+
+        saved, errors = self.parking_spot_repository.bulk_upsert(spots, source='provisioning')
+        failures.extend({"spotId": spot_id, "error": error} for spot_id, error in errors.items())
+        return saved, failures
+
+    def list_parking_spots(self, status=None, parking_id=None, label_prefix=None, after=None, limit=100):
+        return self.parking_spot_repository.find_page(status, parking_id, label_prefix, after, limit)
+
+    def get_occupancy(self, parking_id=None):
+        return self.parking_spot_repository.get_occupancy(parking_id)
+
+    def get_history(self, resolution, parking_id=None, start=None, end=None, limit=10000):
+        return self.parking_spot_repository.get_history(resolution, parking_id, start, end, limit)
+
+    def get_analytics(self, start, end, parking_id=None, per_spot=False):
+        return self.parking_spot_repository.get_analytics(start, end, parking_id, per_spot)
+
+    def get_snapshot(self):
+        return self.parking_spot_repository.snapshot()
+
+    def get_event_hub(self):
+        return self.parking_spot_repository.get_event_hub()
+
+    def get_state_version(self) -> int:
+        return self.parking_spot_repository.get_state_version()
+
+    def get_spot_statuses(self):
+        return self.parking_spot_repository.get_statuses()
 
     def update_parking_spot(self, edge_id: str, spot_id: str, status: str, api_key: str):
         # Validate the device using the auth service
@@ -38,4 +90,4 @@ class ParkingSpotApplicationService:
         updated_spot = self.parking_spot_service.update_spot(spot, status)
 
         # Save the updated parking spot to the repository
-        return self.parking_spot_repository.save(updated_spot)
\ No newline at end of file
+        return self.parking_spot_repository.save(updated_spot, source='api')
\ No newline at end of file
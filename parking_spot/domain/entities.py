@@ -1,12 +1,19 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Union
+
+
+@dataclass(frozen=True, slots=True)
 class ParkingSpot:
-    def __init__(self, mac_address=None, device_type=None, spot_id=None, status=None,
-                 spot_label=None, parking_id=None, edge_id=None, last_updated=None, created_at=None):
-        self.mac_address = mac_address
-        self.device_type = device_type
-        self.spot_id = spot_id
-        self.status = status
-        self.spot_label = spot_label
-        self.parking_id = parking_id
-        self.edge_id = edge_id
-        self.last_updated = last_updated
-        self.created_at = created_at
\ No newline at end of file
+    mac_address: Optional[str] = None
+    device_type: Optional[str] = None
+    spot_id: Optional[str] = None
+    status: Optional[str] = None
+    spot_label: Optional[str] = None
+    parking_id: Optional[int] = None
+    edge_id: Optional[str] = None
+    last_updated: Union[datetime, str, None] = None
+    created_at: Union[datetime, str, None] = None
+    # Small integer that stands in for spot_id in binary device frames; assigned at provisioning
+    handle: Optional[int] = None
+    wire_format: str = "json"
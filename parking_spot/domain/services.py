@@ -1,9 +1,12 @@
+from dataclasses import replace
 from datetime import timezone, datetime
 
 from dateutil.parser import parse
 
 from parking_spot.domain.entities import ParkingSpot
 
+SPOT_STATUSES = ("AVAILABLE", "OCCUPIED", "RESERVED")
+
 
 class ParkingSpotService:
     def __init__(self):
@@ -24,13 +27,17 @@ class ParkingSpotService:
             created_at=datetime.now(timezone.utc).isoformat()
         )
 
+    @staticmethod
+    def validate_spot(spot: ParkingSpot):
+        for field in ("spot_id", "spot_label", "parking_id", "edge_id", "device_type"):
+            if getattr(spot, field) in (None, ""):
+                raise ValueError(f"Missing {field}")
+        if spot.status not in SPOT_STATUSES:
+            raise ValueError("Invalid status")
 
     @staticmethod
     def update_spot(spot: ParkingSpot, status: str) -> ParkingSpot:
-        if status not in ["AVAILABLE", "OCCUPIED", "RESERVED"]:
+        if status not in SPOT_STATUSES:
             raise ValueError("Invalid status")
-        
-        spot.status = status
-        spot.last_updated = datetime.now(timezone.utc).isoformat()
 
-        return spot
\ No newline at end of file
+        return replace(spot, status=status, last_updated=datetime.now(timezone.utc).isoformat())
\ No newline at end of file
@@ -0,0 +1,341 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from peewee import Case, chunked
+
+from parking_spot.domain.services import SPOT_STATUSES
+from parking_spot.infrastructure.models import AnalyticsBucket, AnalyticsCheckpoint, AnalyticsSpotState, SpotTransition
+from shared.infrastructure.database import db
+
+load_dotenv()
+
+UNKNOWN = -1
+OCCUPIED = SPOT_STATUSES.index("OCCUPIED")
+RESERVED = SPOT_STATUSES.index("RESERVED")
+
+# Rows of the per-bucket accumulator, one column per spot
+ARRIVALS, DWELL_SUM, DWELL_COUNT, LATENCY_SUM, LATENCY_COUNT, OCCUPIED_SECONDS = range(6)
+_METRICS = 6
+_BUCKET_FIELDS = [AnalyticsBucket.bucket, AnalyticsBucket.spot_id, AnalyticsBucket.parking_id,
+                  AnalyticsBucket.arrivals, AnalyticsBucket.dwell_sum, AnalyticsBucket.dwell_count,
+                  AnalyticsBucket.latency_sum, AnalyticsBucket.latency_count, AnalyticsBucket.occupied_seconds]
+_STATE_FIELDS = [AnalyticsSpotState.spot_id, AnalyticsSpotState.parking_id, AnalyticsSpotState.state_code,
+                 AnalyticsSpotState.state_since]
+
+
+def _status_code(field):
+    return Case(field, [(status, code) for code, status in enumerate(SPOT_STATUSES)], UNKNOWN)
+
+
+class OccupancyAnalytics:
+    """Dwell time, turnover, utilisation and reservation-to-occupation latency from ``spot_transitions``.
+
+    Transitions are read in id order, in chunks, into NumPy columns and
+    folded into one accumulator per time bucket (a ``metrics x spots``
+    array). Only transitions with an id above the last one seen are read,
+    so each refresh costs as much as the new history, not the whole of it.
+    Stays that are still open are added when a summary is computed and are
+    not stored. Buckets older than ``retention`` seconds are dropped.
+
+    Raw transitions are only kept for a couple of days, so ``checkpoint``
+    writes the buckets and the state of every spot that changed since the
+    last one, with the id of the last transition folded in. It runs before
+    the transition log prunes, and the first refresh after a restart loads
+    the checkpoint and continues from there.
+    """
+
+    def __init__(self, bucket_seconds: int = 3600, retention: float = 31 * 86400, chunk_size: int = 100000):
+        self.bucket_seconds = bucket_seconds
+        self.retention = retention
+        self.chunk_size = chunk_size
+
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._spot_index: Dict[str, int] = {}
+        self._spot_ids: List[str] = []
+        self._spot_parking = np.empty(0, dtype=np.int64)
+        self._state_code = np.empty(0, dtype=np.int8)
+        self._state_since = np.empty(0, dtype=np.int64)
+        self._buckets: Dict[int, np.ndarray] = {}
+        self._loaded = False
+        self._dirty_buckets = set()
+        self._dirty_spots = set()
+
+    def summary(self, start: int, end: int, spots: Iterable[Tuple[str, int]] = (),
+                parking_id: Optional[int] = None, per_spot: bool = False) -> Dict[str, Any]:
+        """Metrics per parking (and optionally per spot) for the buckets overlapping ``[start, end)``.
+
+        ``start`` and ``end`` are epoch seconds. ``spots`` are ``(spot_id, parking_id)`` pairs of
+        every current spot, so spots without transitions still count towards capacity.
+        """
+        size = self.bucket_seconds
+        start = start // size * size
+        end = -(-end // size) * size
+        now = time.time()
+
+        with self._lock:
+            self.refresh()
+            for spot_id, spot_parking_id in spots:
+                self._index(spot_id, spot_parking_id)
+
+            count = len(self._spot_ids)
+            keys = np.arange(start, end, size, dtype=np.int64)
+            totals = np.zeros((_METRICS, count))
+            occupied = np.zeros((len(keys), count))
+            for row, key in enumerate(keys.tolist()):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    totals[:, :bucket.shape[1]] += bucket
+                    occupied[row, :bucket.shape[1]] = bucket[OCCUPIED_SECONDS]
+
+            # Stays still in progress count towards utilisation up to now
+            open_spots = np.flatnonzero((self._state_code == OCCUPIED) & (self._state_since >= 0))
+            if len(open_spots):
+                seconds, segments, overlap = self._split(self._state_since[open_spots],
+                                                         np.full(len(open_spots), int(now * 1000)))
+                in_range = (seconds >= start) & (seconds < end)
+                np.add.at(occupied, ((seconds[in_range] - start) // size, open_spots[segments[in_range]]),
+                          overlap[in_range])
+                np.add.at(totals[OCCUPIED_SECONDS], open_spots[segments[in_range]], overlap[in_range])
+
+            spot_parking = self._spot_parking[:count].copy()
+            spot_ids = list(self._spot_ids)
+
+        # Seconds of each bucket that have already happened
+        elapsed = np.clip(now - keys, 0, size)
+        observed = elapsed.sum()
+
+        parkings, parking_of_spot = np.unique(spot_parking, return_inverse=True)
+        membership = np.zeros((count, len(parkings)))
+        membership[np.arange(count), parking_of_spot] = 1
+        capacity = membership.sum(axis=0)
+        by_parking = totals @ membership
+        occupied_by_bucket = occupied @ membership
+        with np.errstate(divide='ignore', invalid='ignore'):
+            utilisation_by_bucket = occupied_by_bucket / (elapsed[:, None] * capacity)
+        utilisation_by_bucket = np.nan_to_num(utilisation_by_bucket)
+        peak = utilisation_by_bucket.argmax(axis=0) if len(keys) else np.zeros(len(parkings), dtype=np.int64)
+
+        days = observed / 86400
+        result = []
+        for column, key in enumerate(parkings.tolist()):
+            if parking_id is not None and key != parking_id:
+                continue
+            metrics = by_parking[:, column]
+            spots_in_parking = capacity[column]
+            result.append({
+                'parkingId': key,
+                'spots': int(spots_in_parking),
+                'arrivals': int(metrics[ARRIVALS]),
+                'turnoverPerSpotPerDay': _ratio(metrics[ARRIVALS], spots_in_parking * days),
+                'avgDwellSeconds': _ratio(metrics[DWELL_SUM], metrics[DWELL_COUNT]),
+                'avgReservationLatencySeconds': _ratio(metrics[LATENCY_SUM], metrics[LATENCY_COUNT]),
+                'utilisation': _ratio(metrics[OCCUPIED_SECONDS], spots_in_parking * observed),
+                'peakBucket': int(keys[peak[column]]) if len(keys) else None,
+                'peakUtilisation': float(utilisation_by_bucket[peak[column], column]) if len(keys) else None,
+            })
+
+        summary = {'from': int(start), 'to': int(end), 'bucketSeconds': size, 'parkings': result}
+        if per_spot:
+            selected = np.arange(count) if parking_id is None else np.flatnonzero(spot_parking == parking_id)
+            summary['spots'] = [{
+                'spotId': spot_ids[index],
+                'parkingId': int(spot_parking[index]),
+                'arrivals': int(totals[ARRIVALS, index]),
+                'turnoverPerDay': _ratio(totals[ARRIVALS, index], days),
+                'avgDwellSeconds': _ratio(totals[DWELL_SUM, index], totals[DWELL_COUNT, index]),
+                'avgReservationLatencySeconds': _ratio(totals[LATENCY_SUM, index], totals[LATENCY_COUNT, index]),
+                'utilisation': _ratio(totals[OCCUPIED_SECONDS, index], observed),
+            } for index in selected.tolist()]
+        return summary
+
+    def refresh(self) -> int:
+        """Fold transitions added since the last refresh into the buckets. Returns the number read."""
+        if not self._loaded:
+            self._load()
+
+        read = 0
+        while True:
+            query = (SpotTransition
+                     .select(SpotTransition.id, SpotTransition.ts, SpotTransition.spot_id,
+                             SpotTransition.parking_id, _status_code(SpotTransition.new_status))
+                     .where(SpotTransition.id > self._last_id)
+                     .order_by(SpotTransition.id)
+                     .limit(self.chunk_size))
+            # Raw cursor rows: every column is already a plain int or str, skip peewee's per-row conversion
+            rows = db.execute(query).fetchall()
+            if not rows:
+                break
+            ids, ts, spot_ids, parking_ids, codes = zip(*rows)
+            self._apply(np.array(ts, dtype=np.int64), self._index_many(spot_ids, parking_ids),
+                        np.array(codes, dtype=np.int8))
+            self._last_id = ids[-1]
+            read += len(rows)
+            if len(rows) < self.chunk_size:
+                break
+
+        cutoff = time.time() - self.retention
+        for key in [key for key in self._buckets if key + self.bucket_seconds < cutoff]:
+            del self._buckets[key]
+            self._dirty_buckets.discard(key)
+        return read
+
+    def checkpoint(self) -> int:
+        """Refresh, then persist what changed since the last checkpoint. Returns the number of bucket rows written."""
+        with self._lock:
+            self.refresh()
+            size = self.bucket_seconds
+            bucket_rows = []
+            for key in sorted(self._dirty_buckets):
+                bucket = self._buckets[key]
+                for index in np.flatnonzero(bucket.any(axis=0)).tolist():
+                    bucket_rows.append((key, self._spot_ids[index], int(self._spot_parking[index]),
+                                        *bucket[:, index].tolist()))
+            state_rows = [(self._spot_ids[index], int(self._spot_parking[index]), int(self._state_code[index]),
+                           int(self._state_since[index])) for index in sorted(self._dirty_spots)]
+
+            with db.atomic():
+                for chunk in chunked(bucket_rows, 500):
+                    AnalyticsBucket.insert_many(chunk, fields=_BUCKET_FIELDS).on_conflict_replace().execute()
+                for chunk in chunked(state_rows, 500):
+                    AnalyticsSpotState.insert_many(chunk, fields=_STATE_FIELDS).on_conflict_replace().execute()
+                AnalyticsCheckpoint.insert(id=1, last_transition_id=self._last_id,
+                                           bucket_seconds=size).on_conflict_replace().execute()
+                AnalyticsBucket.delete().where(AnalyticsBucket.bucket + size < time.time() - self.retention).execute()
+            self._dirty_buckets.clear()
+            self._dirty_spots.clear()
+            return len(bucket_rows)
+
+    def _load(self):
+        checkpoint = AnalyticsCheckpoint.get_or_none(AnalyticsCheckpoint.id == 1)
+        if checkpoint is not None:
+            for spot_id, parking_id, code, since in AnalyticsSpotState.select(*_STATE_FIELDS).tuples():
+                index = self._index(spot_id, parking_id)
+                self._state_code[index] = code
+                self._state_since[index] = since
+
+            if checkpoint.bucket_seconds == self.bucket_seconds:
+                size = self.bucket_seconds
+                rows = list(AnalyticsBucket.select(*_BUCKET_FIELDS)
+                            .where(AnalyticsBucket.bucket + size >= time.time() - self.retention).tuples())
+                indexes = [self._index(row[1], row[2]) for row in rows]
+                count = len(self._spot_ids)
+                for row, index in zip(rows, indexes):
+                    bucket = self._buckets.get(row[0])
+                    if bucket is None:
+                        bucket = self._buckets[row[0]] = np.zeros((_METRICS, count), dtype=np.float32)
+                    bucket[:, index] = row[3:]
+            else:
+                print(f"Analytics bucket size changed from {checkpoint.bucket_seconds}s to {self.bucket_seconds}s, "
+                      f"the persisted buckets are discarded")
+                AnalyticsBucket.delete().execute()
+            self._last_id = checkpoint.last_transition_id
+        self._loaded = True
+
+    def _apply(self, ts: np.ndarray, spots: np.ndarray, codes: np.ndarray):
+        # Group by spot, keeping id (and so time) order within each spot
+        order = np.argsort(spots, kind='stable')
+        ts, spots, codes = ts[order], spots[order], codes[order]
+
+        first = np.ones(len(spots), dtype=bool)
+        first[1:] = spots[1:] != spots[:-1]
+        last = np.ones(len(spots), dtype=bool)
+        last[:-1] = first[1:]
+
+        # Each transition closes the stay that started with the previous one for the same spot
+        previous_ts = np.empty_like(ts)
+        previous_ts[1:] = ts[:-1]
+        previous_ts[first] = self._state_since[spots[first]]
+        previous_code = np.empty_like(codes)
+        previous_code[1:] = codes[:-1]
+        previous_code[first] = self._state_code[spots[first]]
+        known = previous_ts >= 0
+        duration = (ts - previous_ts) / 1000
+
+        arrivals = (codes == OCCUPIED) & (previous_code != OCCUPIED)
+        self._accumulate(ts[arrivals] // 1000, spots[arrivals], ARRIVALS)
+
+        stays = known & (previous_code == OCCUPIED)
+        self._accumulate(ts[stays] // 1000, spots[stays], DWELL_SUM, duration[stays])
+        self._accumulate(ts[stays] // 1000, spots[stays], DWELL_COUNT)
+        seconds, segments, overlap = self._split(previous_ts[stays], ts[stays])
+        self._accumulate(seconds, spots[stays][segments], OCCUPIED_SECONDS, overlap)
+
+        claimed = known & (previous_code == RESERVED) & (codes == OCCUPIED)
+        self._accumulate(ts[claimed] // 1000, spots[claimed], LATENCY_SUM, duration[claimed])
+        self._accumulate(ts[claimed] // 1000, spots[claimed], LATENCY_COUNT)
+
+        self._dirty_spots.update(spots[last].tolist())
+        self._state_code[spots[last]] = codes[last]
+        self._state_since[spots[last]] = ts[last]
+
+    def _accumulate(self, seconds: np.ndarray, spots: np.ndarray, metric: int, weights: np.ndarray = None):
+        if not len(seconds):
+            return
+        count = len(self._spot_ids)
+        keys, positions = np.unique(seconds // self.bucket_seconds * self.bucket_seconds, return_inverse=True)
+        sums = np.bincount(positions * count + spots, weights=weights,
+                           minlength=len(keys) * count).reshape(len(keys), count)
+        self._dirty_buckets.update(keys.tolist())
+        for row, key in enumerate(keys.tolist()):
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.shape[1] < count:
+                grown = np.zeros((_METRICS, count), dtype=np.float32)
+                if bucket is not None:
+                    grown[:, :bucket.shape[1]] = bucket
+                bucket = self._buckets[key] = grown
+            bucket[metric] += sums[row]
+
+    def _split(self, starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Split ``[start, end)`` millisecond intervals at bucket boundaries.
+
+        Returns the bucket (epoch seconds), the index of the interval and the seconds it spends in that bucket.
+        """
+        size = self.bucket_seconds * 1000
+        valid = np.flatnonzero(ends > starts)
+        starts, ends = starts[valid], ends[valid]
+        first = starts // size
+        spans = (ends - 1) // size - first + 1
+        segments = np.repeat(np.arange(len(starts)), spans)
+        offsets = np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+        buckets = first[segments] + offsets
+        overlap = (np.minimum(ends[segments], (buckets + 1) * size) -
+                   np.maximum(starts[segments], buckets * size)) / 1000
+        return buckets * self.bucket_seconds, valid[segments], overlap
+
+    def _index_many(self, spot_ids: Tuple[str, ...], parking_ids: Tuple[int, ...]) -> np.ndarray:
+        unique, first, inverse = np.unique(np.array(spot_ids, dtype=object), return_index=True, return_inverse=True)
+        mapping = np.array([self._index(spot_id, parking_ids[position])
+                            for spot_id, position in zip(unique.tolist(), first.tolist())], dtype=np.int64)
+        return mapping[inverse]
+
+    def _index(self, spot_id: str, parking_id: int) -> int:
+        index = self._spot_index.get(spot_id)
+        if index is not None:
+            return index
+
+        index = self._spot_index[spot_id] = len(self._spot_ids)
+        self._spot_ids.append(spot_id)
+        if index == len(self._spot_parking):
+            capacity = max(64, 2 * index)
+            self._spot_parking = np.resize(self._spot_parking, capacity)
+            self._state_code = np.concatenate([self._state_code,
+                                               np.full(capacity - index, UNKNOWN, dtype=np.int8)])
+            self._state_since = np.concatenate([self._state_since,
+                                                np.full(capacity - index, -1, dtype=np.int64)])
+        self._spot_parking[index] = parking_id
+        return index
+
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    return float(numerator / denominator) if denominator else None
+
+
+occupancy_analytics = OccupancyAnalytics(
+    bucket_seconds=int(os.getenv("ANALYTICS_BUCKET_SECONDS", "3600")),
+    retention=float(os.getenv("ANALYTICS_RETENTION_DAYS", "31")) * 86400
+)
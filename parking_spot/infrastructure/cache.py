@@ -0,0 +1,154 @@
+import threading
+from bisect import bisect_right, insort
+from dataclasses import replace
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from parking_spot.domain.entities import ParkingSpot
+
+
+class SpotStateCache:
+    """In-memory copy of ``parking_spots`` keyed by ``spot_id`` with secondary
+    indexes on the lowercased MAC address and on the binary frame handle.
+
+    Entities are immutable, so the cached instances are handed out as they are.
+    ``version`` increases on every change, so it can be used to tell readers
+    whether anything changed since they last looked. Listeners are called with
+    ``(previous, current, version, source)`` for every change, in version order;
+    ``source`` says where the change came from (sensor, cloud, api, ...).
+    """
+
+    def __init__(self):
+        self._by_id: Dict[str, ParkingSpot] = {}
+        self._id_by_mac: Dict[str, str] = {}
+        self._id_by_handle: Dict[int, str] = {}
+        self._sorted_ids: List[str] = []
+        self._listeners: List[Callable[[Optional[ParkingSpot], ParkingSpot, int, Optional[str]], None]] = []
+        self._lock = threading.RLock()
+        self.complete = False
+        self.version = 0
+
+    def exclusive(self):
+        """The cache lock, for callers that must see the state without concurrent changes"""
+        return self._lock
+
+    def add_listener(self, listener: Callable[[Optional[ParkingSpot], ParkingSpot, int, Optional[str]], None]):
+        self._listeners.append(listener)
+
+    def warm(self, spots: Iterable[ParkingSpot]):
+        """Replace the cached state with every spot in the table."""
+        by_id = {}
+        id_by_mac = {}
+        id_by_handle = {}
+        for spot in spots:
+            by_id[spot.spot_id] = spot
+            if spot.mac_address:
+                id_by_mac[spot.mac_address.lower()] = spot.spot_id
+            if spot.handle is not None:
+                id_by_handle[spot.handle] = spot.spot_id
+
+        with self._lock:
+            self._by_id = by_id
+            self._id_by_mac = id_by_mac
+            self._id_by_handle = id_by_handle
+            self._sorted_ids = sorted(by_id)
+            self.complete = True
+            self.version += 1
+
+    def get(self, spot_id: str) -> Optional[ParkingSpot]:
+        with self._lock:
+            return self._by_id.get(spot_id)
+
+    def get_many(self, spot_ids: Iterable[str]) -> Dict[str, ParkingSpot]:
+        """The cached spots among ``spot_ids``, read in one go"""
+        with self._lock:
+            return {spot_id: self._by_id[spot_id] for spot_id in spot_ids if spot_id in self._by_id}
+
+    def get_by_mac(self, mac_address: str) -> Optional[ParkingSpot]:
+        with self._lock:
+            spot_id = self._id_by_mac.get(mac_address.lower())
+            return self._by_id.get(spot_id) if spot_id else None
+
+    def spot_id_for_handle(self, handle: int) -> Optional[str]:
+        # Hot path for every binary frame: a single dict read is atomic, so no lock is taken
+        return self._id_by_handle.get(handle)
+
+    def statuses(self) -> Dict[str, str]:
+        """Current status of every cached spot, keyed by ``spot_id``"""
+        with self._lock:
+            return {spot_id: spot.status for spot_id, spot in self._by_id.items()}
+
+    def snapshot(self) -> Tuple[List[ParkingSpot], int]:
+        """Every cached spot ordered by ``spot_id``, with the version they were read at"""
+        with self._lock:
+            return [self._by_id[spot_id] for spot_id in self._sorted_ids], self.version
+
+    def page(self, status: Optional[str] = None, parking_id: Optional[int] = None,
+             label_prefix: Optional[str] = None, after: Optional[str] = None,
+             limit: int = 100) -> Tuple[List[ParkingSpot], Optional[str], int]:
+        """Spots matching the filters, ordered by ``spot_id`` and starting after the ``after`` cursor.
+
+        Returns the spots, the cursor for the next page (None on the last page) and the version they were read at.
+        """
+        with self._lock:
+            ids = self._sorted_ids
+            start = bisect_right(ids, after) if after is not None else 0
+            spots = []
+            for index in range(start, len(ids)):
+                spot = self._by_id[ids[index]]
+                if status is not None and spot.status != status:
+                    continue
+                if parking_id is not None and spot.parking_id != parking_id:
+                    continue
+                if label_prefix is not None and not (spot.spot_label or "").startswith(label_prefix):
+                    continue
+                if len(spots) == limit:
+                    return spots, spots[-1].spot_id, self.version
+                spots.append(spot)
+            return spots, None, self.version
+
+    def put(self, spot: ParkingSpot, source: Optional[str] = None):
+        self.put_many((spot,), source)
+
+    def put_many(self, spots: Iterable[ParkingSpot], source: Optional[str] = None):
+        with self._lock:
+            for spot in spots:
+                previous = self._by_id.get(spot.spot_id)
+                if previous is None:
+                    insort(self._sorted_ids, spot.spot_id)
+                self._unindex(spot.spot_id)
+                self._by_id[spot.spot_id] = spot
+                if spot.mac_address:
+                    self._id_by_mac[spot.mac_address.lower()] = spot.spot_id
+                if spot.handle is not None:
+                    self._id_by_handle[spot.handle] = spot.spot_id
+                self.version += 1
+                self._notify(previous, spot, source)
+
+    def update_status(self, spot_id: str, status: str, last_updated,
+                      source: Optional[str] = None) -> Optional[ParkingSpot]:
+        with self._lock:
+            spot = self._by_id.get(spot_id)
+            if not spot:
+                return None
+            previous = spot
+            spot = replace(spot, status=status, last_updated=last_updated)
+            self._by_id[spot_id] = spot
+            self.version += 1
+            self._notify(previous, spot, source)
+            return spot
+
+    def _notify(self, previous: Optional[ParkingSpot], current: ParkingSpot, source: Optional[str]):
+        for listener in self._listeners:
+            try:
+                listener(previous, current, self.version, source)
+            except Exception as e:
+                print(f"Error notifying parking spot change: {e}")
+
+    def _unindex(self, spot_id: str):
+        previous = self._by_id.pop(spot_id, None)
+        if previous and previous.mac_address:
+            mac = previous.mac_address.lower()
+            if self._id_by_mac.get(mac) == spot_id:
+                del self._id_by_mac[mac]
+        if previous and previous.handle is not None and self._id_by_handle.get(previous.handle) == spot_id:
+            del self._id_by_handle[previous.handle]
@@ -0,0 +1,96 @@
+import json
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Tuple
+
+
+class SlowConsumerError(Exception):
+    """The subscriber fell further behind than the event buffer reaches"""
+
+
+class EventHubClosedError(Exception):
+    """The hub was closed while a subscriber was waiting"""
+
+
+class SpotEventHub:
+    """Fan-out of spot status transitions to any number of stream subscribers.
+
+    Events live in one shared ring buffer instead of a queue per subscriber.
+    A subscriber only keeps a cursor (the id of the last event it saw), so
+    publishing costs the same no matter how many clients are connected. A
+    subscriber whose cursor falls out of the buffer is a slow consumer and is
+    disconnected; it can reconnect and start over from a snapshot.
+    """
+
+    def __init__(self, buffer_size: int = 1024, max_subscribers: int = 200):
+        self.max_subscribers = max_subscribers
+        self._events: deque = deque(maxlen=buffer_size)
+        self._evicted_up_to = 0
+        self._condition = threading.Condition()
+        self._subscribers = 0
+        self._closed = False
+        self._wakers: List[Callable[[], None]] = []
+
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+    def publish(self, event_id: int, data: Dict[str, Any]):
+        payload = json.dumps(data)
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self._evicted_up_to = self._events[0][0]
+            self._events.append((event_id, payload))
+            self._condition.notify_all()
+        self._wake()
+
+    def add_waker(self, waker: Callable[[], None]):
+        """Call ``waker`` after every publish and on close, for subscribers that can't block in events_after"""
+        self._wakers.append(waker)
+
+    def acquire(self) -> bool:
+        with self._condition:
+            if self._closed or self._subscribers >= self.max_subscribers:
+                return False
+            self._subscribers += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self._subscribers -= 1
+
+    def can_resume(self, cursor: int) -> bool:
+        """True if every event after ``cursor`` is still in the buffer"""
+        with self._condition:
+            return cursor >= self._evicted_up_to
+
+    def events_after(self, cursor: int, timeout: float) -> List[Tuple[int, str]]:
+        """Events newer than ``cursor``, waiting up to ``timeout`` seconds for one to arrive"""
+        with self._condition:
+            if not self._has_events_after(cursor) and not self._closed:
+                self._condition.wait(timeout)
+            if self._closed:
+                raise EventHubClosedError()
+            if cursor < self._evicted_up_to:
+                raise SlowConsumerError()
+
+            events = []
+            for event in reversed(self._events):
+                if event[0] <= cursor:
+                    break
+                events.append(event)
+            events.reverse()
+            return events
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._wake()
+
+    def _wake(self):
+        for waker in self._wakers:
+            waker()
+
+    def _has_events_after(self, cursor: int) -> bool:
+        return bool(self._events) and self._events[-1][0] > cursor
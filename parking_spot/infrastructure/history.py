@@ -0,0 +1,278 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from peewee import Case, Value, chunked, fn
+
+from parking_spot.domain.entities import ParkingSpot
+from parking_spot.infrastructure.models import SpotTransition, OccupancyRollup
+from shared.infrastructure.background import run_until_stopped
+from shared.infrastructure.database import db
+from shared.infrastructure.metrics import registry, pipeline_stage_seconds
+
+load_dotenv()
+
+MINUTE = 60
+HOUR = 3600
+# Rollup resolutions accepted by ``TransitionLog.rollups``, in seconds
+RESOLUTIONS = {"minute": MINUTE, "hour": HOUR}
+
+_FIELDS = [SpotTransition.ts, SpotTransition.spot_id, SpotTransition.parking_id,
+           SpotTransition.old_status, SpotTransition.new_status, SpotTransition.source]
+_ROLLUP_FIELDS = [OccupancyRollup.parking_id, OccupancyRollup.period, OccupancyRollup.bucket,
+                  OccupancyRollup.transitions, OccupancyRollup.occupied, OccupancyRollup.vacated,
+                  OccupancyRollup.reserved]
+
+
+_history_write_seconds = pipeline_stage_seconds.labels('history_write')
+_transitions_dropped = registry.counter('spot_transitions_dropped', 'Transitions dropped because the log fell behind')
+
+
+def _count_if(condition):
+    return fn.SUM(Case(None, [(condition, 1)], 0))
+
+
+class TransitionLog:
+    """Append-only history of spot status transitions, with per-parking rollups.
+
+    ``record`` is registered as a spot cache listener and only appends to an
+    in-memory buffer. A background thread writes the buffer to
+    ``spot_transitions`` with multi-row inserts in one transaction, when
+    ``max_batch`` transitions are waiting or every ``flush_interval`` seconds.
+    If the database falls more than ``max_pending`` transitions behind, the
+    oldest buffered ones are dropped.
+
+    ``maintain`` rolls every completed minute up into per-parking minute
+    buckets, every completed hour into hour buckets (from the minute buckets),
+    and deletes raw transitions and rollups older than their retention, so
+    disk usage stays bounded. Listeners added with ``add_prune_listener`` run
+    before raw transitions are deleted; if one fails they are kept for now.
+    """
+
+    def __init__(self, max_batch: int = 500, flush_interval: float = 1.0, max_pending: int = 100000,
+                 raw_retention: float = 2 * 86400, minute_retention: float = 7 * 86400,
+                 hour_retention: float = 365 * 86400):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.raw_retention = raw_retention
+        self.minute_retention = minute_retention
+        self.hour_retention = hour_retention
+
+        self._pending: deque = deque(maxlen=max_pending)
+        self._dropped = 0
+        self._rolled_up_to: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._maintenance_lock = threading.Lock()
+        self._has_pending = threading.Event()
+        self._batch_full = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._maintenance_thread: Optional[threading.Thread] = None
+        self._prune_listeners: List[Callable[[], object]] = []
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="spot-transition-log", daemon=True)
+            self._thread.start()
+
+    def record(self, previous: Optional[ParkingSpot], current: ParkingSpot, version: int = None,
+               source: str = None):
+        if previous is not None and previous.status == current.status:
+            return
+        if self._thread is None:
+            self.start()
+
+        old_status = previous.status if previous else None
+        with self._lock:
+            # Timestamps are taken under the lock so the buffer is always in ts order
+            row = (int(time.time() * 1000), current.spot_id, current.parking_id, old_status, current.status, source)
+            if len(self._pending) == self.max_pending:
+                self._dropped += 1
+                _transitions_dropped.inc()
+            self._pending.append(row)
+            pending = len(self._pending)
+
+        if pending == 1:
+            self._has_pending.set()
+        if pending >= self.max_batch:
+            self._batch_full.set()
+
+    def add_prune_listener(self, listener: Callable[[], object]):
+        self._prune_listeners.append(listener)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """Write every buffered transition now. Returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                rows, self._pending = self._pending, deque(maxlen=self.max_pending)
+                dropped, self._dropped = self._dropped, 0
+
+            if dropped:
+                print(f"Transition log fell behind, dropped {dropped} oldest transitions")
+            try:
+                with _history_write_seconds.time(), db.atomic():
+                    for chunk in chunked(rows, self.max_batch):
+                        SpotTransition.insert_many(chunk, fields=_FIELDS).execute()
+            except Exception as e:
+                print(f"Error writing spot transitions: {e}")
+                with self._lock:
+                    # Put the batch back in front of anything recorded meanwhile
+                    retained = deque(rows, maxlen=self.max_pending)
+                    overflow = max(0, len(rows) + len(self._pending) - self.max_pending)
+                    self._dropped += overflow
+                    _transitions_dropped.inc(overflow)
+                    retained.extend(self._pending)
+                    self._pending = retained
+                self._has_pending.set()
+                return 0
+            return len(rows)
+
+    def maintain(self):
+        """Roll up completed minutes and hours, then apply retention"""
+        with self._maintenance_lock:
+            now = int(time.time())
+            self.flush()
+            minute_end = now // MINUTE * MINUTE
+            with self._lock:
+                oldest = self._pending[0][0] // 1000 if self._pending else None
+            if oldest is not None and oldest < minute_end:
+                # Transitions from those minutes are still waiting to be written
+                print("Skipping transition rollup: pending transitions could not be written")
+                return
+
+            prune_raw = True
+            for listener in self._prune_listeners:
+                try:
+                    listener()
+                except Exception as e:
+                    print(f"Keeping raw spot transitions, a prune listener failed: {e}")
+                    prune_raw = False
+
+            with db.atomic():
+                minutes_done = self._rollup_minutes(minute_end)
+                hours_done = self._rollup_hours(minutes_done // HOUR * HOUR)
+
+                if prune_raw:
+                    raw_cutoff = min(now - self.raw_retention, minutes_done)
+                    SpotTransition.delete().where(SpotTransition.ts < int(raw_cutoff * 1000)).execute()
+                minute_cutoff = min(now - self.minute_retention, hours_done)
+                OccupancyRollup.delete().where((OccupancyRollup.period == MINUTE) &
+                                               (OccupancyRollup.bucket < minute_cutoff)).execute()
+                OccupancyRollup.delete().where((OccupancyRollup.period == HOUR) &
+                                               (OccupancyRollup.bucket < now - self.hour_retention)).execute()
+            self._rolled_up_to[MINUTE] = minutes_done
+            self._rolled_up_to[HOUR] = hours_done
+
+    def rollups(self, period: int, parking_id: Optional[int] = None, start: Optional[int] = None,
+                end: Optional[int] = None, limit: int = 10000) -> List[Tuple[int, int, int, int, int, int]]:
+        """``(parking_id, bucket, transitions, occupied, vacated, reserved)`` rows of one resolution,
+        for buckets starting in ``[start, end)`` (epoch seconds), ordered by bucket"""
+        query = (OccupancyRollup
+                 .select(OccupancyRollup.parking_id, OccupancyRollup.bucket, OccupancyRollup.transitions,
+                         OccupancyRollup.occupied, OccupancyRollup.vacated, OccupancyRollup.reserved)
+                 .where(OccupancyRollup.period == period))
+        if parking_id is not None:
+            query = query.where(OccupancyRollup.parking_id == parking_id)
+        if start is not None:
+            query = query.where(OccupancyRollup.bucket >= start)
+        if end is not None:
+            query = query.where(OccupancyRollup.bucket < end)
+        return list(query.order_by(OccupancyRollup.bucket, OccupancyRollup.parking_id).limit(limit).tuples())
+
+    def start_maintenance(self, interval: float):
+        if interval <= 0 or (self._maintenance_thread and self._maintenance_thread.is_alive()):
+            return
+        self._maintenance_thread = threading.Thread(target=self._run_maintenance, args=(interval,),
+                                                    name="spot-transition-rollups", daemon=True)
+        self._maintenance_thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the background threads and write whatever is still buffered."""
+        self._stopped.set()
+        self._has_pending.set()
+        self._batch_full.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._maintenance_thread:
+            self._maintenance_thread.join(timeout)
+            self._maintenance_thread = None
+        self.flush()
+
+    def _rollup_minutes(self, end: int) -> int:
+        start = self._watermark(MINUTE, end)
+        if start < end:
+            bucket = SpotTransition.ts / (MINUTE * 1000) * MINUTE
+            query = (SpotTransition
+                     .select(SpotTransition.parking_id, Value(MINUTE), bucket, fn.COUNT(SpotTransition.id),
+                             _count_if(SpotTransition.new_status == 'OCCUPIED'),
+                             _count_if(SpotTransition.old_status == 'OCCUPIED'),
+                             _count_if(SpotTransition.new_status == 'RESERVED'))
+                     .where((SpotTransition.ts >= start * 1000) & (SpotTransition.ts < end * 1000))
+                     .group_by(SpotTransition.parking_id, bucket))
+            OccupancyRollup.insert_from(query, _ROLLUP_FIELDS).on_conflict_replace().execute()
+        return max(start, end)
+
+    def _rollup_hours(self, end: int) -> int:
+        start = self._watermark(HOUR, end)
+        if start < end:
+            bucket = OccupancyRollup.bucket / HOUR * HOUR
+            query = (OccupancyRollup
+                     .select(OccupancyRollup.parking_id, Value(HOUR), bucket, fn.SUM(OccupancyRollup.transitions),
+                             fn.SUM(OccupancyRollup.occupied), fn.SUM(OccupancyRollup.vacated),
+                             fn.SUM(OccupancyRollup.reserved))
+                     .where((OccupancyRollup.period == MINUTE) &
+                            (OccupancyRollup.bucket >= start) & (OccupancyRollup.bucket < end))
+                     .group_by(OccupancyRollup.parking_id, bucket))
+            OccupancyRollup.insert_from(query, _ROLLUP_FIELDS).on_conflict_replace().execute()
+        return max(start, end)
+
+    def _watermark(self, period: int, end: int) -> int:
+        """Start of the first bucket of ``period`` that has not been rolled up yet"""
+        if period in self._rolled_up_to:
+            return self._rolled_up_to[period]
+
+        last = (OccupancyRollup.select(fn.MAX(OccupancyRollup.bucket))
+                .where(OccupancyRollup.period == period).scalar())
+        if last is not None:
+            return last + period
+        if period == MINUTE:
+            first = SpotTransition.select(fn.MIN(SpotTransition.ts)).scalar()
+            first = first // 1000 if first is not None else None
+        else:
+            first = (OccupancyRollup.select(fn.MIN(OccupancyRollup.bucket))
+                     .where(OccupancyRollup.period == MINUTE).scalar())
+        return first // period * period if first is not None else end
+
+    def _run(self):
+        run_until_stopped(self.flush, self._stopped, self.flush_interval, "Error writing spot transitions",
+                          self._has_pending, self._batch_full)
+
+    def _run_maintenance(self, interval: float):
+        run_until_stopped(self.maintain, self._stopped, interval, "Error rolling up spot transitions")
+
+
+transition_log = TransitionLog(
+    max_batch=int(os.getenv("HISTORY_MAX_BATCH", "500")),
+    flush_interval=int(os.getenv("HISTORY_FLUSH_MS", "1000")) / 1000,
+    max_pending=int(os.getenv("HISTORY_MAX_PENDING", "100000")),
+    raw_retention=float(os.getenv("HISTORY_RAW_RETENTION_HOURS", "48")) * 3600,
+    minute_retention=float(os.getenv("HISTORY_MINUTE_RETENTION_DAYS", "7")) * 86400,
+    hour_retention=float(os.getenv("HISTORY_HOUR_RETENTION_DAYS", "365")) * 86400
+)
+registry.gauge('spot_transition_log_pending', 'Transitions waiting to be written').set_function(
+    transition_log.pending_count)
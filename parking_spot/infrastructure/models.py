@@ -1,4 +1,4 @@
-from peewee import Model, AutoField, CharField, IntegerField
+from peewee import Model, AutoField, CharField, IntegerField, DateTimeField, FloatField, CompositeKey
 from shared.infrastructure.database import db
 
 class ParkingSpot(Model):
@@ -9,9 +9,92 @@ class ParkingSpot(Model):
     parking_id = IntegerField()
     edge_id = CharField()
     device_type = CharField()
-    last_updated = CharField()
-    created_at = CharField()
+    last_updated = DateTimeField()
+    created_at = DateTimeField()
+    handle = IntegerField(null=True)
+    wire_format = CharField(default='json')
 
     class Meta:
         database = db
-        table_name = 'parking_spots'  # Ensure the table name is pluralized
\ No newline at end of file
+        table_name = 'parking_spots'  # Ensure the table name is pluralized
+        # Indexes, including the unique one on lower(mac_address), are created by shared.infrastructure.migrations
+
+
+class SpotTransition(Model):
+    """Append-only log of spot status changes; ``ts`` is in epoch milliseconds"""
+    # AUTOINCREMENT in the table (migration 6): ids are never reused after pruning
+    id = AutoField()
+    ts = IntegerField()
+    spot_id = CharField()
+    parking_id = IntegerField()
+    old_status = CharField(null=True)
+    new_status = CharField()
+    source = CharField(null=True)
+
+    class Meta:
+        database = db
+        table_name = 'spot_transitions'
+        indexes = (
+            (('ts',), False),
+            (('parking_id', 'ts'), False),
+        )
+
+
+class OccupancyRollup(Model):
+    """Transitions per parking aggregated over ``period`` seconds starting at ``bucket`` (epoch seconds)"""
+    parking_id = IntegerField()
+    period = IntegerField()
+    bucket = IntegerField()
+    transitions = IntegerField()
+    occupied = IntegerField()
+    vacated = IntegerField()
+    reserved = IntegerField()
+
+    class Meta:
+        database = db
+        table_name = 'spot_occupancy_rollups'
+        primary_key = CompositeKey('period', 'parking_id', 'bucket')
+        indexes = (
+            (('period', 'bucket'), False),
+        )
+
+
+class AnalyticsBucket(Model):
+    """Occupancy analytics accumulated for one spot over the bucket starting at ``bucket`` (epoch seconds)"""
+    bucket = IntegerField()
+    spot_id = CharField()
+    parking_id = IntegerField()
+    arrivals = FloatField()
+    dwell_sum = FloatField()
+    dwell_count = FloatField()
+    latency_sum = FloatField()
+    latency_count = FloatField()
+    occupied_seconds = FloatField()
+
+    class Meta:
+        database = db
+        table_name = 'spot_analytics_buckets'
+        primary_key = CompositeKey('bucket', 'spot_id')
+
+
+class AnalyticsSpotState(Model):
+    """Status of a spot as of the last transition folded into the analytics, and since when (epoch ms)"""
+    spot_id = CharField(primary_key=True)
+    parking_id = IntegerField()
+    state_code = IntegerField()
+    state_since = IntegerField()
+
+    class Meta:
+        database = db
+        table_name = 'spot_analytics_state'
+
+
+class AnalyticsCheckpoint(Model):
+    """Single row: the last transition folded into the persisted analytics and the bucket size used"""
+    id = IntegerField(primary_key=True)
+    last_transition_id = IntegerField()
+    bucket_seconds = IntegerField()
+
+    class Meta:
+        database = db
+        table_name = 'spot_analytics_checkpoint'
@@ -0,0 +1,70 @@
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from parking_spot.domain.entities import ParkingSpot
+from parking_spot.domain.services import SPOT_STATUSES
+from shared.infrastructure.background import run_until_stopped
+
+
+class OccupancyCounters:
+    """Number of spots per parking and status, kept up to date on every transition.
+
+    ``apply`` is registered as a spot cache listener, so it runs under the
+    cache lock and sees transitions in the order they were committed.
+    """
+
+    def __init__(self):
+        self._counts: Dict[int, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def apply(self, previous: Optional[ParkingSpot], current: ParkingSpot, version: int = None,
+              source: str = None):
+        if previous is not None and previous.status == current.status and previous.parking_id == current.parking_id:
+            return
+        with self._lock:
+            if previous is not None:
+                self._add(previous.parking_id, previous.status, -1)
+            self._add(current.parking_id, current.status, 1)
+
+    def reset(self, rows: Iterable[Tuple[int, str, int]]):
+        """Replace the counters with ``(parking_id, status, count)`` rows. Returns True if they had drifted."""
+        counts: Dict[int, Dict[str, int]] = {}
+        for parking_id, status, count in rows:
+            counts.setdefault(parking_id, dict.fromkeys(SPOT_STATUSES, 0))[status] = count
+        with self._lock:
+            current = {key: value for key, value in self._counts.items() if any(value.values())}
+            drifted = bool(current) and current != counts
+            self._counts = counts
+        return drifted
+
+    def get(self, parking_id: Optional[int] = None) -> Dict[int, Dict[str, int]]:
+        with self._lock:
+            if parking_id is not None:
+                counts = self._counts.get(parking_id)
+                return {parking_id: dict(counts)} if counts else {}
+            return {key: dict(value) for key, value in self._counts.items()}
+
+    def start_reconciler(self, reconcile: Callable[[], None], interval: float):
+        if interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(reconcile, interval),
+                                        name="occupancy-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop_reconciler(self, timeout: float = 5.0):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self, reconcile: Callable[[], None], interval: float):
+        run_until_stopped(reconcile, self._stopped, interval, "Error reconciling occupancy counters")
+
+    def _add(self, parking_id: int, status: str, delta: int):
+        counts = self._counts.get(parking_id)
+        if counts is None:
+            counts = self._counts[parking_id] = dict.fromkeys(SPOT_STATUSES, 0)
+        counts[status] = counts.get(status, 0) + delta
@@ -1,95 +1,348 @@
+from parking_spot.infrastructure.analytics import occupancy_analytics
+from parking_spot.infrastructure.cache import SpotStateCache
+from parking_spot.infrastructure.events import SpotEventHub
+from parking_spot.infrastructure.history import RESOLUTIONS, transition_log
+from parking_spot.infrastructure.occupancy import OccupancyCounters
 from parking_spot.infrastructure.models import ParkingSpot as ParkingSpotModel
+from parking_spot.infrastructure.write_behind import spot_status_writer
 from parking_spot.domain.entities import ParkingSpot
+from shared.infrastructure.database import db
+from shared.infrastructure.mapper import RowMapper
+from shared.infrastructure.metrics import pipeline_stage_seconds
+from shared.infrastructure.wire import BINARY, MAX_HANDLE, WIRE_FORMATS
+from collections import defaultdict
+from dataclasses import replace
 from datetime import datetime
+from peewee import IntegrityError, chunked, fn
+import os
+
+spot_mapper = RowMapper(ParkingSpotModel, ParkingSpot)
+
+# Process-wide state shared by every repository instance
+spot_cache = SpotStateCache()
+spot_events = SpotEventHub(
+    buffer_size=int(os.getenv("SPOT_EVENTS_BUFFER_SIZE", "1024")),
+    max_subscribers=int(os.getenv("SPOT_EVENTS_MAX_SUBSCRIBERS", "200"))
+)
+
+
+def _normalize_mac(mac_address):
+    # MACs are stored lowercase so lookups, the cache index and the unique index all agree
+    return mac_address.lower() if mac_address else mac_address
+
+
+def _publish_transition(previous, current, version, source=None):
+    if previous is not None and previous.status == current.status:
+        return
+    spot_events.publish(version, {
+        'spotId': current.spot_id,
+        'parkingId': current.parking_id,
+        'label': current.spot_label,
+        'previousStatus': previous.status if previous else None,
+        'status': current.status,
+        'source': source,
+    })
+
+
+spot_cache.add_listener(_publish_transition)
+
+_db_read_seconds = pipeline_stage_seconds.labels('db_read')
+_db_write_seconds = pipeline_stage_seconds.labels('db_write')
+
+occupancy = OccupancyCounters()
+spot_cache.add_listener(occupancy.apply)
+spot_cache.add_listener(transition_log.record)
+# Analytics are checkpointed before raw transitions are pruned, so they outlive the raw retention
+transition_log.add_prune_listener(occupancy_analytics.checkpoint)
+
 
 class ParkingSpotRepository:
     @staticmethod
-    def save(parking_spot):
-        spot = ParkingSpotModel.get_or_none(spot_id=parking_spot.spot_id)
-        if not spot:
-            spot = ParkingSpotModel.create(
-                spot_id = parking_spot.spot_id,
-                spot_label = parking_spot.spot_label,
-                status = parking_spot.status,
-                mac_address = parking_spot.mac_address,
-                parking_id = parking_spot.parking_id,
-                edge_id = parking_spot.edge_id,
-                device_type = parking_spot.device_type,
-                last_updated = datetime.now(),
-                created_at = datetime.now()
-            )
-        else:
-            spot.spot_label = parking_spot.spot_label
-            spot.status = parking_spot.status
-            spot.mac_address = parking_spot.mac_address
-            spot.parking_id = parking_spot.parking_id
-            spot.edge_id = parking_spot.edge_id
-            spot.device_type = parking_spot.device_type
-            spot.last_updated = datetime.now()
-            spot.save()
-
-        return ParkingSpot(
-            spot_id=spot.spot_id,
-            spot_label=spot.spot_label,
-            status=spot.status,
-            mac_address=spot.mac_address,
-            parking_id=spot.parking_id,
-            edge_id=spot.edge_id,
-            device_type=spot.device_type,
-            last_updated=spot.last_updated,
-            created_at=spot.created_at
-        )
-
-    @staticmethod
-    def update_spot_status(spot_id, status):
-        spot = ParkingSpotModel.get(spot_id=spot_id)
-        if not spot:
+    def warm_cache():
+        """Load every parking spot into the in-memory cache"""
+        spot_cache.warm(spot_mapper.from_rows(spot_mapper.select()))
+
+    @staticmethod
+    def save(parking_spot, source=None):
+        mac_address = _normalize_mac(parking_spot.mac_address)
+
+        # The full row written below supersedes any status change still waiting to be flushed; holding
+        # off flushes keeps one already taken from the queue from landing on top of it, and holding the
+        # cache lock keeps a concurrent status change from being overwritten in the cache
+        with spot_cache.exclusive():
+            try:
+                spot = ParkingSpotRepository._write_spot(parking_spot, mac_address)
+            except IntegrityError:
+                # The only constraint a well-formed spot can break is the unique index on the MAC
+                raise ValueError(f"MAC address {mac_address} is already assigned to another parking spot")
+            saved = spot_mapper.from_model(spot)
+            spot_cache.put(saved, source)
+        return saved
+
+    @staticmethod
+    def _write_spot(parking_spot, mac_address):
+        with spot_status_writer.superseded([parking_spot.spot_id]), db.atomic():
+            spot = ParkingSpotModel.get_or_none(spot_id=parking_spot.spot_id)
+            if not spot:
+                spot = ParkingSpotModel.create(
+                    spot_id = parking_spot.spot_id,
+                    spot_label = parking_spot.spot_label,
+                    status = parking_spot.status,
+                    mac_address = mac_address,
+                    parking_id = parking_spot.parking_id,
+                    edge_id = parking_spot.edge_id,
+                    device_type = parking_spot.device_type,
+                    last_updated = datetime.now(),
+                    created_at = datetime.now()
+                )
+            else:
+                spot.spot_label = parking_spot.spot_label
+                spot.status = parking_spot.status
+                spot.mac_address = mac_address
+                spot.parking_id = parking_spot.parking_id
+                spot.edge_id = parking_spot.edge_id
+                spot.device_type = parking_spot.device_type
+                spot.last_updated = datetime.now()
+                spot.save()
+        return spot
+
+    @staticmethod
+    def bulk_upsert(parking_spots, chunk_size=100, source=None):
+        """Insert or update many parking spots in one transaction.
+
+        Returns the saved spots and a ``{spot_id: error}`` dict for the rows that failed.
+        """
+        now = datetime.now()
+        rows = {}
+        for parking_spot in parking_spots:
+            rows[parking_spot.spot_id] = spot_mapper.to_dict(replace(
+                parking_spot, mac_address=_normalize_mac(parking_spot.mac_address), last_updated=now, created_at=now))
+
+        failures = {}
+        # Pending status changes are dropped on exit for the ids still in here, so failed rows keep theirs
+        written = set(rows)
+        # As in save(): the rows written supersede pending status changes, and the cache lock keeps a
+        # concurrent status change from being overwritten by the rows read back below
+        with spot_cache.exclusive():
+            with spot_status_writer.superseded(written), db.atomic():
+                for chunk in chunked(list(rows.values()), chunk_size):
+                    try:
+                        with db.atomic():
+                            ParkingSpotRepository._upsert_rows(chunk)
+                    except Exception:
+                        # Find the offending rows so the rest of the chunk still goes through
+                        for row in chunk:
+                            try:
+                                with db.atomic():
+                                    ParkingSpotRepository._upsert_rows([row])
+                            except Exception as e:
+                                failures[row['spot_id']] = str(e)
+                                written.discard(row['spot_id'])
+
+            saved_ids = [spot_id for spot_id in rows if spot_id not in failures]
+            saved = []
+            for chunk in chunked(saved_ids, chunk_size):
+                saved.extend(spot_mapper.from_rows(spot_mapper.select().where(ParkingSpotModel.spot_id.in_(chunk))))
+            spot_cache.put_many(saved, source)
+        return saved, failures
+
+    @staticmethod
+    def _upsert_rows(rows):
+        ParkingSpotModel.insert_many(rows).on_conflict(
+            conflict_target=[ParkingSpotModel.spot_id],
+            preserve=[ParkingSpotModel.spot_label, ParkingSpotModel.status, ParkingSpotModel.mac_address,
+                      ParkingSpotModel.parking_id, ParkingSpotModel.edge_id, ParkingSpotModel.device_type,
+                      ParkingSpotModel.last_updated]
+        ).execute()
+
+    @staticmethod
+    def update_spot_status(spot_id, status, source=None):
+        last_updated = datetime.now()
+        if not ParkingSpotRepository.get_by_id(spot_id):
             raise ValueError("Parking spot not found")
-        
-        spot.status = status
-        spot.last_updated = datetime.now()
-        spot.save()
-        return ParkingSpot(
-            spot_id=spot.spot_id,
-            spot_label=spot.spot_label,
-            status=spot.status,
-            mac_address=spot.mac_address,
-            parking_id=spot.parking_id,
-            edge_id=spot.edge_id,
-            device_type=spot.device_type,
-            last_updated=spot.last_updated,
-            created_at=spot.created_at
-        )
+
+        # Queue the write under the cache lock so anyone holding it sees the cache and the queue agree
+        with spot_cache.exclusive():
+            spot = spot_cache.update_status(spot_id, status, last_updated, source)
+            spot_status_writer.submit(spot_id, status)
+        return spot
+
+    @staticmethod
+    def update_spot_statuses(statuses, source=None, chunk_size=500):
+        """Change the status of several spots in one transaction, all or nothing.
+
+        ``statuses`` maps spot_id to the new status. Returns the updated spots and the ids that
+        do not exist; if there are any, nothing is changed.
+        """
+        if not spot_cache.complete:
+            ParkingSpotRepository.warm_cache()
+        last_updated = datetime.now()
+
+        with spot_cache.exclusive():
+            current = spot_cache.get_many(statuses)
+            missing = [spot_id for spot_id in statuses if spot_id not in current]
+            if missing:
+                return [], missing
+
+            by_status = defaultdict(list)
+            for spot_id, status in statuses.items():
+                by_status[status].append(spot_id)
+            with spot_status_writer.superseded(statuses), _db_write_seconds.time(), db.atomic():
+                for status, spot_ids in by_status.items():
+                    for chunk in chunked(spot_ids, chunk_size):
+                        ParkingSpotModel.update(status=status, last_updated=last_updated).where(
+                            ParkingSpotModel.spot_id.in_(chunk)
+                        ).execute()
+
+            updated = [replace(current[spot_id], status=status, last_updated=last_updated)
+                       for spot_id, status in statuses.items()]
+            spot_cache.put_many(updated, source)
+        return updated, []
+
+    @staticmethod
+    def write_statuses(changes):
+        """Persist a batch of ``{spot_id: (status, last_updated)}`` changes in one transaction"""
+        with db.atomic():
+            for spot_id, (status, last_updated) in changes.items():
+                ParkingSpotModel.update(status=status, last_updated=last_updated).where(
+                    ParkingSpotModel.spot_id == spot_id
+                ).execute()
 
     @staticmethod
     def get_by_id(spot_id):
-        spot = ParkingSpotModel.get(spot_id=spot_id)
-        if not spot:
+        spot = spot_cache.get(spot_id)
+        if spot or spot_cache.complete:
+            return spot
+
+        with _db_read_seconds.time():
+            row = spot_mapper.select().where(ParkingSpotModel.spot_id == spot_id).first()
+        if not row:
             return None
-        return ParkingSpot(
-            spot_id=spot.spot_id,
-            spot_label=spot.spot_label,
-            status=spot.status,
-            mac_address=spot.mac_address,
-            parking_id=spot.parking_id,
-            edge_id=spot.edge_id,
-            device_type=spot.device_type,
-            last_updated=spot.last_updated,
-            created_at=spot.created_at
-        )
+        spot = spot_mapper.from_row(row)
+        spot_cache.put(spot)
+        return spot
+
+    @staticmethod
+    def get_statuses():
+        """Current status of every parking spot, keyed by spot_id"""
+        if not spot_cache.complete:
+            ParkingSpotRepository.warm_cache()
+        return spot_cache.statuses()
+
+    @staticmethod
+    def find_page(status=None, parking_id=None, label_prefix=None, after=None, limit=100):
+        """Keyset-paginated spot listing served from the cache; see ``SpotStateCache.page``"""
+        if not spot_cache.complete:
+            ParkingSpotRepository.warm_cache()
+        return spot_cache.page(status, parking_id, label_prefix, after, limit)
+
+    @staticmethod
+    def snapshot():
+        """Every parking spot and the state version it was read at"""
+        if not spot_cache.complete:
+            ParkingSpotRepository.warm_cache()
+        return spot_cache.snapshot()
+
+    @staticmethod
+    def reconcile_occupancy(attempts=3):
+        """Recount spots per parking and status from the table and replace the counters"""
+        for _ in range(attempts):
+            # Status writes are queued under the cache lock, so the version and the queue agree here
+            with spot_cache.exclusive():
+                version = spot_cache.version
+            spot_status_writer.flush()
+            rows = list(ParkingSpotModel
+                        .select(ParkingSpotModel.parking_id, ParkingSpotModel.status, fn.COUNT(ParkingSpotModel.spot_id))
+                        .group_by(ParkingSpotModel.parking_id, ParkingSpotModel.status)
+                        .tuples())
+
+            # The count is only valid if nothing changed since the flush and everything made it to the table
+            with spot_cache.exclusive():
+                if spot_cache.version != version:
+                    continue
+                if spot_status_writer.pending_count():
+                    print("Skipping occupancy reconciliation: pending status changes could not be written")
+                    return
+                if occupancy.reset(rows):
+                    print("Occupancy counters drifted from parking_spots and were corrected")
+                return
+        print("Skipping occupancy reconciliation: spot statuses kept changing while counting")
+
+    @staticmethod
+    def start_occupancy_reconciler(interval):
+        occupancy.start_reconciler(ParkingSpotRepository.reconcile_occupancy, interval)
+
+    @staticmethod
+    def stop_occupancy_reconciler():
+        occupancy.stop_reconciler()
+
+    @staticmethod
+    def get_occupancy(parking_id=None):
+        return occupancy.get(parking_id)
+
+    @staticmethod
+    def get_history(resolution, parking_id=None, start=None, end=None, limit=10000):
+        """Per-parking transition rollups at ``resolution`` ("minute" or "hour") for buckets in ``[start, end)``"""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}")
+        return transition_log.rollups(RESOLUTIONS[resolution], parking_id, start, end, limit)
+
+    @staticmethod
+    def get_analytics(start, end, parking_id=None, per_spot=False):
+        """Dwell, turnover, utilisation and reservation latency per parking over ``[start, end)``"""
+        spots, _ = ParkingSpotRepository.snapshot()
+        return occupancy_analytics.summary(start, end, [(spot.spot_id, spot.parking_id) for spot in spots],
+                                           parking_id, per_spot)
+
+    @staticmethod
+    def start_history_maintenance(interval):
+        transition_log.start_maintenance(interval)
+
+    @staticmethod
+    def get_event_hub():
+        return spot_events
+
+    @staticmethod
+    def get_state_version():
+        return spot_cache.version
 
     @staticmethod
     def get_by_mac(mac_address):
         mac_address = mac_address.lower()
-        spot = ParkingSpotModel.get(mac_address=mac_address)
-        return ParkingSpot(
-            spot_id=spot.spot_id,
-            spot_label=spot.spot_label,
-            status=spot.status,
-            mac_address=spot.mac_address,
-            parking_id=spot.parking_id,
-            edge_id=spot.edge_id,
-            device_type=spot.device_type,
-            last_updated=spot.last_updated,
-            created_at=spot.created_at
-        )
\ No newline at end of file
+        spot = spot_cache.get_by_mac(mac_address)
+        if spot or spot_cache.complete:
+            return spot
+
+        with _db_read_seconds.time():
+            row = spot_mapper.select().where(fn.lower(ParkingSpotModel.mac_address) == mac_address).first()
+        if not row:
+            return None
+        spot = spot_mapper.from_row(row)
+        spot_cache.put(spot)
+        return spot
+
+    @staticmethod
+    def set_wire_format(spot_id, wire_format):
+        """Switch the payload encoding of a spot's device; a handle is assigned the first time it asks for binary"""
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"wire format must be one of {', '.join(WIRE_FORMATS)}")
+
+        with spot_cache.exclusive():
+            spot = ParkingSpotRepository.get_by_id(spot_id)
+            if not spot:
+                raise ValueError("Parking spot not found")
+            handle = spot.handle
+            if wire_format == BINARY and handle is None:
+                # Next handle after the highest one in use
+                handle = (ParkingSpotModel.select(fn.MAX(ParkingSpotModel.handle)).scalar() or 0) + 1
+                if handle > MAX_HANDLE:
+                    raise ValueError("No spot handles left")
+            if handle == spot.handle and wire_format == spot.wire_format:
+                return spot
+
+            ParkingSpotModel.update(handle=handle, wire_format=wire_format).where(
+                ParkingSpotModel.spot_id == spot_id
+            ).execute()
+            updated = replace(spot, handle=handle, wire_format=wire_format)
+            spot_cache.put(updated, 'provisioning')
+        return updated
@@ -0,0 +1,119 @@
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from shared.infrastructure.background import run_until_stopped
+from shared.infrastructure.metrics import registry, pipeline_stage_seconds
+
+load_dotenv()
+
+_db_write_seconds = pipeline_stage_seconds.labels('db_write')
+
+
+class SpotStatusWriteBehind:
+    """Coalesces parking spot status changes in memory and writes them to
+    ``parking_spots`` in a single transaction.
+
+    Only the latest change per spot is kept. A flush happens when
+    ``max_batch`` distinct spots are pending or ``flush_interval`` seconds
+    have passed since the first pending change, whichever comes first.
+    Reads never look at the queue: changes are submitted under the spot
+    cache lock right after the cache is updated, so the cache already holds
+    every pending status.
+    """
+
+    def __init__(self, max_batch: int = 256, flush_interval: float = 0.5):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+
+        self._pending: Dict[str, Tuple[str, datetime]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._has_pending = threading.Event()
+        self._batch_full = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="spot-write-behind", daemon=True)
+            self._thread.start()
+
+    def submit(self, spot_id: str, status: str):
+        """Queue a status change; a newer change for the same spot replaces the older one."""
+        if self._thread is None:
+            self.start()
+
+        with self._lock:
+            self._pending[spot_id] = (status, datetime.now())
+            pending = len(self._pending)
+
+        if pending == 1:
+            self._has_pending.set()
+        if pending >= self.max_batch:
+            self._batch_full.set()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    @contextmanager
+    def superseded(self, spot_ids: Iterable[str]):
+        """Hold off flushes while ``spot_ids`` are written directly; if the write succeeds their
+        pending changes are dropped, so an older change can never land on top of it."""
+        with self._flush_lock:
+            yield
+            with self._lock:
+                for spot_id in spot_ids:
+                    self._pending.pop(spot_id, None)
+
+    def flush(self) -> int:
+        """Write every pending change now. Returns the number of spots written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                changes, self._pending = self._pending, {}
+
+            from parking_spot.infrastructure.repositories import ParkingSpotRepository
+            try:
+                with _db_write_seconds.time():
+                    ParkingSpotRepository.write_statuses(changes)
+            except Exception as e:
+                print(f"Error flushing parking spot status changes: {e}")
+                with self._lock:
+                    # Keep anything newer that arrived while we were writing
+                    for spot_id, change in changes.items():
+                        self._pending.setdefault(spot_id, change)
+                self._has_pending.set()
+                return 0
+            return len(changes)
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the background flusher and write whatever is still pending."""
+        self._stopped.set()
+        self._has_pending.set()
+        self._batch_full.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        run_until_stopped(self.flush, self._stopped, self.flush_interval, "Error flushing parking spot status changes",
+                          self._has_pending, self._batch_full)
+
+
+spot_status_writer = SpotStatusWriteBehind(
+    max_batch=int(os.getenv("SPOT_WRITE_BEHIND_MAX_BATCH", "256")),
+    flush_interval=int(os.getenv("SPOT_WRITE_BEHIND_FLUSH_MS", "500")) / 1000
+)
+registry.gauge('spot_write_behind_pending', 'Spot status changes waiting to be written').set_function(
+    spot_status_writer.pending_count)
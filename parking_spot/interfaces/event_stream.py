@@ -0,0 +1,235 @@
+"""
+Server-sent events of spot status changes, served without a thread per client.
+
+``SpotEventStreamServer`` answers ``GET /parking-spots/stream`` on its own
+port from a single asyncio loop. Every client is a coroutine holding a cursor
+into the ``SpotEventHub`` ring buffer; the hub wakes the loop after each
+publish, and each client then writes whatever is newer than its cursor. The
+HTTP workers are left for ordinary requests, and the number of streams is only
+limited by SPOT_EVENTS_MAX_SUBSCRIBERS.
+
+The helpers below format the events for this server and for the threaded
+Flask route used in development.
+"""
+import asyncio
+import json
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from parking_spot.infrastructure.events import EventHubClosedError, SlowConsumerError
+
+# Distinguishes state versions across restarts, since the version counter starts over
+state_epoch = int(time.time())
+
+_HEADERS = (b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"X-Accel-Buffering: no\r\n"
+            b"Access-Control-Allow-Origin: *\r\n"
+            b"Connection: close\r\n\r\n")
+_REASONS = {400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 503: "Service Unavailable"}
+
+
+def spot_to_json(spot):
+    last_updated = spot.last_updated
+    return {
+        'spotId': spot.spot_id,
+        'label': spot.spot_label,
+        'status': spot.status,
+        'mac': spot.mac_address,
+        'parkingId': spot.parking_id,
+        'edgeId': spot.edge_id,
+        'deviceType': spot.device_type,
+        'lastUpdated': last_updated.isoformat() if hasattr(last_updated, 'isoformat') else last_updated,
+    }
+
+
+def parse_event_id(value: Optional[str]) -> Optional[int]:
+    """Version from a Last-Event-ID sent by this process, None for anything else"""
+    epoch, _, version = (value or '').partition('-')
+    if epoch != str(state_epoch) or not version.isdigit():
+        return None
+    return int(version)
+
+
+def resume_cursor(service, hub, last_event_id: Optional[int]) -> Optional[int]:
+    """The cursor to resume from, or None if the client needs a fresh snapshot"""
+    if (last_event_id is not None and hub.can_resume(last_event_id)
+            and last_event_id <= service.get_state_version()):
+        return last_event_id
+    return None
+
+
+def snapshot_event(spots, cursor: int) -> str:
+    data = json.dumps({'spots': [spot_to_json(spot) for spot in spots]})
+    return f"event: snapshot\nid: {state_epoch}-{cursor}\ndata: {data}\n\n"
+
+
+def status_events(events: List[Tuple[int, str]]) -> str:
+    return "".join(f"event: status\nid: {state_epoch}-{event_id}\ndata: {data}\n\n" for event_id, data in events)
+
+
+class SpotEventStreamServer:
+    """Serves the spot event stream from one asyncio loop running on a background thread"""
+
+    def __init__(self, service, host: str = "127.0.0.1", port: int = 5001, heartbeat: float = 15,
+                 request_timeout: float = 10):
+        self.service = service
+        self.hub = service.get_event_hub()
+        self.host = host
+        self.port = port
+        self.heartbeat = heartbeat
+        self.request_timeout = request_timeout
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed: Optional[asyncio.Future] = None
+        self._wake_scheduled = False
+        self._stopping: Optional[asyncio.Future] = None
+        self._clients = set()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hub.add_waker(self._wake)
+
+    def start(self, timeout: float = 5.0):
+        if self._thread and self._thread.is_alive():
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(),), name="spot-event-stream",
+                                        daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            raise RuntimeError(f"Event stream server did not start on {self.host}:{self.port}")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop accepting clients and wait up to ``timeout`` seconds for the open streams to end"""
+        if self._loop and self._stopping:
+            self._loop.call_soon_threadsafe(self._stopping.set_result, timeout)
+        if self._thread:
+            self._thread.join(timeout + 1)
+            self._thread = None
+
+    def _wake(self):
+        # Called by the hub from any thread; one wake-up per loop iteration however many events arrive
+        loop = self._loop
+        if loop is None or self._wake_scheduled:
+            return
+        self._wake_scheduled = True
+        try:
+            loop.call_soon_threadsafe(self._notify)
+        except RuntimeError:
+            # The loop has already been closed
+            pass
+
+    def _notify(self):
+        self._wake_scheduled = False
+        if self._loop is None:
+            return
+        changed, self._changed = self._changed, self._loop.create_future()
+        changed.set_result(None)
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._changed = self._loop.create_future()
+        self._stopping = self._loop.create_future()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+
+        timeout = await self._stopping
+        server.close()
+        if self._clients:
+            _, pending = await asyncio.wait(self._clients, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        await server.wait_closed()
+        self._loop = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._clients.add(task)
+        try:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.request_timeout)
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, target, _ = request_line.split(" ", 2)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError):
+                await self._respond(writer, 400, "Malformed request")
+                return
+            if target.split("?", 1)[0] != "/parking-spots/stream":
+                await self._respond(writer, 404, "Not found")
+                return
+            if method != "GET":
+                await self._respond(writer, 405, "Method not allowed")
+                return
+
+            headers = {}
+            for line in header_lines:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            if not self.hub.acquire():
+                await self._respond(writer, 503, "Too many subscribers")
+                return
+            try:
+                await self._stream(reader, writer, parse_event_id(headers.get("last-event-id")))
+            finally:
+                self.hub.release()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._clients.discard(task)
+            writer.close()
+
+    async def _stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                      last_event_id: Optional[int]):
+        # Clients send nothing after the request, so a completed read means they hung up
+        hung_up = asyncio.ensure_future(reader.read(1))
+        try:
+            await self._send_events(writer, last_event_id, hung_up)
+        finally:
+            hung_up.cancel()
+
+    async def _send_events(self, writer: asyncio.StreamWriter, last_event_id: Optional[int],
+                           hung_up: asyncio.Future):
+        writer.write(_HEADERS + b"retry: 3000\n\n")
+        cursor = resume_cursor(self.service, self.hub, last_event_id)
+        if cursor is None:
+            spots, cursor = self.service.get_snapshot()
+            writer.write(snapshot_event(spots, cursor).encode())
+        await writer.drain()
+
+        while True:
+            # Taken before reading, so a publish right after the read still wakes this client
+            changed = self._changed
+            try:
+                events = self.hub.events_after(cursor, 0)
+            except SlowConsumerError:
+                # The client can reconnect; it will get a fresh snapshot
+                writer.write(b"event: reset\ndata: {}\n\n")
+                await writer.drain()
+                return
+            except EventHubClosedError:
+                return
+
+            if events:
+                writer.write(status_events(events).encode())
+                cursor = events[-1][0]
+                # Waits while the client's socket buffer is full; a client that stays behind
+                # long enough falls out of the hub's buffer and gets a reset
+                await writer.drain()
+                continue
+            done, _ = await asyncio.wait((changed, hung_up), timeout=self.heartbeat,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if hung_up in done:
+                return
+            if not done:
+                writer.write(b": keep-alive\n\n")
+                await writer.drain()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, error: str):
+        body = json.dumps({'error': error}).encode()
+        writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
@@ -1,18 +1,198 @@
+from datetime import datetime, timezone
 from typing import Dict
 
-from flask import Blueprint, jsonify
-import os, requests
+from dateutil.parser import isoparse
+from flask import Blueprint, Response, jsonify, redirect, request
+import json, os, threading, time
 
 from parking_spot.application.services import ParkingSpotApplicationService
+from parking_spot.infrastructure.events import SlowConsumerError, EventHubClosedError
+from parking_spot.interfaces.event_stream import parse_event_id, resume_cursor, snapshot_event, spot_to_json, \
+    state_epoch, status_events
+from shared.infrastructure.http_client import http_client
 
 parking_spot_api = Blueprint('parking_spot_api', __name__)
 
 parking_spot_service = ParkingSpotApplicationService()
 
+_etag_epoch = state_epoch
+# Port of the evented stream server, when app.serve() runs one; the Flask route then redirects to it
+_stream_port = None
+# Serialized pages of the current state version, keyed by query string
+_page_cache: Dict[tuple, bytes] = {}
+_page_cache_version = None
+_page_cache_lock = threading.Lock()
+_PAGE_CACHE_SIZE = 256
+
+
+@parking_spot_api.route('/parking-spots', methods=['GET'])
+def list_parking_spots():
+    global _page_cache, _page_cache_version
+
+    version = parking_spot_service.get_state_version()
+    etag = f'"{_etag_epoch}-{version}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers={'ETag': etag})
+
+    try:
+        parking_id = request.args.get('parkingId', type=int)
+        limit = int(request.args.get('limit', 100))
+        if not 1 <= limit <= 1000:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'limit must be between 1 and 1000'}), 400
+    status = request.args.get('status')
+    label_prefix = request.args.get('labelPrefix')
+    after = request.args.get('after')
+
+    key = (status, parking_id, label_prefix, after, limit)
+    with _page_cache_lock:
+        if _page_cache_version != version:
+            _page_cache, _page_cache_version = {}, version
+        body = _page_cache.get(key)
+    if body is None:
+        spots, next_cursor, read_version = parking_spot_service.list_parking_spots(
+            status, parking_id, label_prefix, after, limit)
+        etag = f'"{_etag_epoch}-{read_version}"'
+        body = json.dumps({
+            'spots': [spot_to_json(spot) for spot in spots],
+            'next': next_cursor,
+        }).encode('utf-8')
+        # Rendering happens outside the lock, so the cache may have moved on to a newer version meanwhile
+        with _page_cache_lock:
+            if read_version == _page_cache_version and len(_page_cache) < _PAGE_CACHE_SIZE:
+                _page_cache[key] = body
+
+    return Response(body, mimetype='application/json', headers={'ETag': etag})
+
+
+@parking_spot_api.route('/parking-spots/occupancy', methods=['GET'])
+def get_occupancy():
+    parking_id = request.args.get('parkingId', type=int)
+    counts = parking_spot_service.get_occupancy(parking_id)
+    return jsonify({
+        'parkings': [
+            {'parkingId': key, 'total': sum(value.values()), **value}
+            for key, value in counts.items()
+        ]
+    }), 200
+
+
+def _parse_epoch(value, default):
+    """Epoch seconds from a query parameter given as epoch seconds or an ISO-8601 timestamp"""
+    if value is None:
+        return default
+    if value.isdigit():
+        return int(value)
+    return int(isoparse(value).timestamp())
+
+
+@parking_spot_api.route('/parking-spots/history', methods=['GET'])
+def get_history():
+    """Per-parking transition rollups over a time range. Only completed minutes are rolled up."""
+    resolution = request.args.get('resolution', 'minute')
+    parking_id = request.args.get('parkingId', type=int)
+    try:
+        end = _parse_epoch(request.args.get('to'), int(time.time()))
+        start = _parse_epoch(request.args.get('from'), end - 86400)
+        limit = int(request.args.get('limit', 10000))
+        if not 1 <= limit <= 10000:
+            raise ValueError("limit must be between 1 and 10000")
+        rows = parking_spot_service.get_history(resolution, parking_id, start, end, limit)
+    except (ValueError, OverflowError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'resolution': resolution,
+        'from': datetime.fromtimestamp(start, timezone.utc).isoformat(),
+        'to': datetime.fromtimestamp(end, timezone.utc).isoformat(),
+        'buckets': [
+            {
+                'parkingId': row_parking_id,
+                'start': datetime.fromtimestamp(bucket, timezone.utc).isoformat(),
+                'transitions': transitions,
+                'occupied': occupied,
+                'vacated': vacated,
+                'reserved': reserved,
+            }
+            for row_parking_id, bucket, transitions, occupied, vacated, reserved in rows
+        ]
+    }), 200
+
+
+@parking_spot_api.route('/parking-spots/analytics', methods=['GET'])
+def get_analytics():
+    """Dwell time, turnover, utilisation and reservation latency per parking, optionally per spot"""
+    parking_id = request.args.get('parkingId', type=int)
+    per_spot = request.args.get('perSpot', 'false').lower() == 'true'
+    try:
+        end = _parse_epoch(request.args.get('to'), int(time.time()))
+        start = _parse_epoch(request.args.get('from'), end - 7 * 86400)
+        if start >= end:
+            raise ValueError("from must be before to")
+    except (ValueError, OverflowError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(parking_spot_service.get_analytics(start, end, parking_id, per_spot)), 200
+
+
+def set_stream_server_port(port):
+    global _stream_port
+    _stream_port = port
+
+
+@parking_spot_api.route('/parking-spots/stream', methods=['GET'])
+def stream_parking_spots():
+    """Server-sent events: a snapshot of every spot, then one event per status transition.
+
+    Under waitress the streams are served by the evented server in
+    parking_spot.interfaces.event_stream and this route redirects there. The
+    development server streams from here, one thread per client. Event ids are
+    ``<epoch>-<version>`` like the ETags, so a Last-Event-ID from before a
+    restart gets a fresh snapshot instead of resuming at the wrong version.
+    """
+    if _stream_port is not None:
+        host = request.host.rsplit(':', 1)[0] if not request.host.endswith(']') else request.host
+        return redirect(f"{request.scheme}://{host}:{_stream_port}{request.full_path.rstrip('?')}", code=307)
+
+    hub = parking_spot_service.get_event_hub()
+    if not hub.acquire():
+        return jsonify({'error': 'Too many subscribers'}), 503
+
+    last_event_id = parse_event_id(request.headers.get('Last-Event-ID'))
+    heartbeat = int(os.environ.get('SPOT_EVENTS_HEARTBEAT', '15'))
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            cursor = resume_cursor(parking_spot_service, hub, last_event_id)
+            if cursor is None:
+                spots, cursor = parking_spot_service.get_snapshot()
+                yield snapshot_event(spots, cursor)
+
+            while True:
+                events = hub.events_after(cursor, heartbeat)
+                if not events:
+                    yield ": keep-alive\n\n"
+                    continue
+                cursor = events[-1][0]
+                yield status_events(events)
+        except SlowConsumerError:
+            # The client can reconnect; it will get a fresh snapshot
+            yield "event: reset\ndata: {}\n\n"
+        except EventHubClosedError:
+            pass
+
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Called when the server closes the response, even if the generator never started
+    response.call_on_close(hub.release)
+    return response
+
+
 def create_parking_spot(parking_id, edge_id):
     try:
         base_url = os.environ.get('CENTRAL_API_URL', 'http://localhost:8081/api/v1')
-        response = requests.get(
+        response = http_client.get(
             f"{base_url}/devices/unassigned/{parking_id}",
             headers=_get_headers()
         )
@@ -20,9 +200,10 @@ def create_parking_spot(parking_id, edge_id):
             devices = response.json()
 
             print(f"{len(devices)} unassigned devices were found.")
+            spots = []
             for i, device in enumerate(devices):
                 print(f"Device {i + 1}:", device)
-                spot = parking_spot_service.create_parking_spot(
+                spots.append(parking_spot_service.create_parking_spot(
                     mac_address=device['macAddress'],
                     device_type='DISTANCE_SENSOR',
                     spot_status=device['spotStatus'],
@@ -30,8 +211,14 @@ def create_parking_spot(parking_id, edge_id):
                     spot_id=device['parkingSpotId'],
                     parking_id=parking_id,
                     edge_id=edge_id
-                )
-                update_device(spot.spot_id, edge_id, spot.device_type)
+                ))
+
+            # Assign the devices to this edge concurrently instead of one PUT at a time
+            results = http_client.fan_out(lambda spot: _put_device(spot.spot_id, edge_id, spot.device_type), spots,
+                                          max_concurrency=int(os.environ.get('DEVICE_UPDATE_CONCURRENCY', '8')))
+            for spot, result in zip(spots, results):
+                if isinstance(result, Exception) or result.status_code != 200:
+                    print(f"Failed to update device {spot.spot_id}: {result if isinstance(result, Exception) else result.text}")
 
             return jsonify(devices), 200
         else:
@@ -44,16 +231,7 @@ def create_parking_spot(parking_id, edge_id):
 
 def update_device(spot_id: str, edge_id: str, device_type: str):
     try:
-        base_url = os.environ.get('CENTRAL_API_UR', 'http://localhost:8081/api/v1')
-        response = requests.put(
-            f"{base_url}/devices/{spot_id}",
-            json={
-                'edgeId': edge_id,
-                'macAddress': ' ',
-                'type': device_type
-            },
-            headers=_get_headers()
-        )
+        response = _put_device(spot_id, edge_id, device_type)
         if response.status_code == 200:
             return jsonify(response.json()), 200
         else:
@@ -64,6 +242,18 @@ def update_device(spot_id: str, edge_id: str, device_type: str):
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
 
+def _put_device(spot_id: str, edge_id: str, device_type: str):
+    base_url = os.environ.get('CENTRAL_API_UR', 'http://localhost:8081/api/v1')
+    return http_client.put(
+        f"{base_url}/devices/{spot_id}",
+        json={
+            'edgeId': edge_id,
+            'macAddress': ' ',
+            'type': device_type
+        },
+        headers=_get_headers()
+    )
+
 def _get_headers() -> Dict[str, str]:
     return {
         'Authorization': f'Bearer {os.environ.get("API_KEY")}',
@@ -2,9 +2,14 @@ import os, requests
 from dotenv import load_dotenv
 from typing import Dict, Any, Optional
 
+from shared.infrastructure.http_client import http_client
+from shared.infrastructure.metrics import pipeline_stage_seconds
+
 # Load environment variables
 load_dotenv()
 
+_backend_api_seconds = pipeline_stage_seconds.labels('backend_api')
+
 
 class BackendApiClient:
     """Client to communicate with the Smart Parking central backend"""
@@ -30,10 +35,11 @@ class BackendApiClient:
                 'password': password
             }
 
-            response = requests.post(
-                f"{self.base_url}/authentication/sign-in",
-                json=payload
-            )
+            with _backend_api_seconds.time():
+                response = http_client.post(
+                    f"{self.base_url}/authentication/sign-in",
+                    json=payload
+                )
 
             response.raise_for_status()
             data = response.json()
@@ -78,11 +84,12 @@ class BackendApiClient:
     def get(self, endpoint: str, params: Optional[Dict] = None) -> Dict[str, Any]:
         """Make a GET request to the backend"""
         try:
-            response = requests.get(
-                f"{self.base_url}/{endpoint}",
-                headers=self._get_headers(),
-                params=params
-            )
+            with _backend_api_seconds.time():
+                response = http_client.get(
+                    f"{self.base_url}/{endpoint}",
+                    headers=self._get_headers(),
+                    params=params
+                )
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -92,11 +99,12 @@ class BackendApiClient:
     def post(self, endpoint: str, data: Dict) -> Dict[str, Any]:
         """Make a POST request to the backend"""
         try:
-            response = requests.post(
-                f"{self.base_url}/{endpoint}",
-                headers=self._get_headers(),
-                json=data
-            )
+            with _backend_api_seconds.time():
+                response = http_client.post(
+                    f"{self.base_url}/{endpoint}",
+                    headers=self._get_headers(),
+                    json=data
+                )
             response.raise_for_status()
             return response.json()
         except Exception as e:
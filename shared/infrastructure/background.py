@@ -0,0 +1,40 @@
+"""
+Loop shared by the background threads that write batches or run periodic
+maintenance against the database.
+"""
+import threading
+from typing import Callable, Optional
+
+from shared.infrastructure.database import db
+
+
+def run_until_stopped(task: Callable[[], object], stopped: threading.Event, interval: float, error_message: str,
+                      has_pending: Optional[threading.Event] = None, batch_full: Optional[threading.Event] = None):
+    """Run ``task`` on the calling thread until ``stopped`` is set.
+
+    Without ``has_pending`` the task runs every ``interval`` seconds. With it,
+    the task is a batch flush: it runs once something is pending and either
+    ``batch_full`` is set or ``interval`` seconds have passed. The owner's
+    stop() sets all three events, so the last batch is still flushed.
+    Exceptions are printed with ``error_message`` and the loop carries on.
+    """
+    while True:
+        if has_pending is None:
+            if stopped.wait(interval):
+                return
+        else:
+            if stopped.is_set():
+                return
+            has_pending.wait()
+            if batch_full is not None:
+                # Give the batch a chance to fill up, but never wait longer than the interval
+                batch_full.wait(interval)
+                batch_full.clear()
+            has_pending.clear()
+
+        try:
+            # Take a pooled connection for each run and hand it back afterwards
+            with db.connection_context():
+                task()
+        except Exception as e:
+            print(f"{error_message}: {e}")
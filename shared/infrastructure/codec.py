@@ -0,0 +1,66 @@
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib json module is used instead
+    orjson = None
+
+
+class DecodeError(ValueError):
+    """The payload could not be decoded"""
+
+
+class JsonCodec:
+    """Turns MQTT payloads into Python objects and back.
+
+    ``encode`` returns bytes ready to hand to paho, so a message is serialized
+    exactly once. Uses orjson when it is installed and the stdlib ``json``
+    module otherwise; both produce compact UTF-8 JSON.
+    """
+
+    def __init__(self, use_orjson: bool = True):
+        self.backend = "orjson" if use_orjson and orjson is not None else "json"
+        if self.backend == "orjson":
+            self._loads = orjson.loads
+            self._dumps = orjson.dumps
+        else:
+            self._loads, self._dumps = _stdlib_functions()
+
+    def decode(self, payload: Union[bytes, bytearray, memoryview, str]) -> Any:
+        try:
+            return self._loads(payload)
+        except (ValueError, TypeError) as e:
+            raise DecodeError(str(e)) from e
+
+    def encode(self, obj: Any) -> bytes:
+        """Bytes are passed through and text is UTF-8 encoded; anything else is serialized as JSON"""
+        if isinstance(obj, bytes):
+            return obj
+        if isinstance(obj, str):
+            return obj.encode('utf-8')
+        return self._dumps(obj)
+
+
+def _stdlib_functions():
+    # Bound methods of one decoder and encoder: json.loads and json.dumps add a layer of argument
+    # checks per call, and json.dumps builds a new encoder whenever the options are not the defaults
+    decode_json = json.JSONDecoder().decode
+    encode_json = json.JSONEncoder(separators=(',', ':')).encode
+
+    def loads(payload):
+        # MQTT payloads are UTF-8; decoding directly skips json.loads' encoding detection
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode('utf-8')
+        elif isinstance(payload, memoryview):
+            payload = payload.tobytes().decode('utf-8')
+        return decode_json(payload)
+
+    def dumps(obj):
+        # Non-ASCII characters are escaped, so the text is plain ASCII and encodes fastest that way
+        return encode_json(obj).encode('ascii')
+
+    return loads, dumps
+
+
+json_codec = JsonCodec()
@@ -1,17 +1,41 @@
 """
 Database initialization module for the SmartParking Edge Server.
 """
-from peewee import SqliteDatabase
+import os
 
+from dotenv import load_dotenv
+from playhouse.pool import PooledSqliteDatabase
 
+load_dotenv()
 
-# Initialize the database connection
-db = SqliteDatabase('smart_parking.db')
+# Each thread gets its own connection from the pool. WAL lets the HTTP
+# handlers keep reading while the MQTT threads write. A connection is only
+# ever used by the thread that checked it out, but it may be opened and
+# closed by different threads (close_all at shutdown), hence
+# check_same_thread=False.
+db = PooledSqliteDatabase(
+    os.getenv('DATABASE_PATH', 'smart_parking.db'),
+    check_same_thread=False,
+    max_connections=int(os.getenv('DATABASE_MAX_CONNECTIONS', '32')),
+    stale_timeout=int(os.getenv('DATABASE_STALE_TIMEOUT', '300')),
+    timeout=int(os.getenv('DATABASE_POOL_TIMEOUT', '10')),
+    pragmas={
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'wal'),
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'normal'),
+        'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-16000')),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024))),
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    }
+)
 
 
 def init_db() -> None:
-    if db.is_closed():
-        db.connect()
-    from parking_spot.infrastructure.models import ParkingSpot
-    from iam.infrastructure.models import EdgeServer
-    db.create_tables([ParkingSpot, EdgeServer], safe=True)
\ No newline at end of file
+    """Create or migrate the schema. Called once at startup, before any request or MQTT message is handled."""
+    from shared.infrastructure.migrations import migrate
+    migrate()
+
+
+def close_db(exc=None) -> None:
+    """Return the current thread's connection to the pool"""
+    if not db.is_closed():
+        db.close()
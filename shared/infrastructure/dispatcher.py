@@ -0,0 +1,163 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from shared.infrastructure.database import close_db
+
+BLOCK = "block"
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+
+_STOP = object()
+
+
+class KeyedWorkerPool:
+    """Bounded pool of worker threads that run handlers off the MQTT network thread.
+
+    Every key is pinned to one worker, so tasks submitted with the same key
+    (e.g. the same ``spotId``) run in submission order. When a worker's queue
+    is full the ``drop_policy`` decides what happens:
+
+    - ``block``: wait up to ``block_timeout`` seconds for room, then drop the new task
+    - ``drop_newest``: drop the new task immediately
+    - ``drop_oldest``: drop the oldest queued task to make room for the new one
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 1000, drop_policy: str = BLOCK,
+                 block_timeout: float = 1.0, name: str = "mqtt-worker"):
+        if drop_policy not in (BLOCK, DROP_NEWEST, DROP_OLDEST):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+
+        self.workers = max(1, workers)
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self.name = name
+
+        per_worker = max(1, queue_size // self.workers)
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=per_worker) for _ in range(self.workers)]
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.handler_time_total = 0.0
+        self.handler_time_max = 0.0
+
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index, tasks in enumerate(self._queues):
+                thread = threading.Thread(target=self._run, args=(tasks,), name=f"{self.name}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, key: Hashable, handler: Callable, *args: Any) -> bool:
+        """Queue ``handler(*args)`` on the worker that owns ``key``. Returns False if it was dropped."""
+        if not self._threads:
+            self.start()
+
+        tasks = self._queues[hash(key) % self.workers]
+        task = (handler, args)
+        try:
+            if self.drop_policy == BLOCK:
+                tasks.put(task, timeout=self.block_timeout)
+            elif self.drop_policy == DROP_NEWEST:
+                tasks.put_nowait(task)
+            else:
+                while True:
+                    try:
+                        tasks.put_nowait(task)
+                        break
+                    except queue.Full:
+                        try:
+                            tasks.get_nowait()
+                            tasks.task_done()
+                            self.dropped += 1
+                        except queue.Empty:
+                            pass
+        except queue.Full:
+            self.dropped += 1
+            self.logger.warning(f"Cola de '{self.name}' llena, mensaje descartado")
+            return False
+
+        self.submitted += 1
+        depth = tasks.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return True
+
+    def queue_depth(self) -> int:
+        return sum(tasks.qsize() for tasks in self._queues)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self.max_queue_depth,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "handler_time_avg": self.handler_time_total / self.processed if self.processed else 0.0,
+            "handler_time_max": self.handler_time_max,
+        }
+
+    def stop(self, drain: bool = True, timeout: Optional[float] = 5.0):
+        """Stop the workers, running whatever is already queued first when ``drain`` is set"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+
+        if not drain:
+            for tasks in self._queues:
+                try:
+                    while True:
+                        tasks.get_nowait()
+                        tasks.task_done()
+                except queue.Empty:
+                    pass
+
+        for tasks in self._queues:
+            # Bypass the size limit so the stop marker never gets dropped
+            with tasks.mutex:
+                tasks.queue.append(_STOP)
+                tasks.unfinished_tasks += 1
+                tasks.not_empty.notify()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def _run(self, tasks: queue.Queue):
+        try:
+            while True:
+                task = tasks.get()
+                try:
+                    if task is _STOP:
+                        return
+                    handler, args = task
+                    started = time.perf_counter()
+                    try:
+                        handler(*args)
+                    except Exception as e:
+                        self.errors += 1
+                        self.logger.error(f"Error en worker '{self.name}': {e}")
+                    elapsed = time.perf_counter() - started
+                    self.processed += 1
+                    self.handler_time_total += elapsed
+                    if elapsed > self.handler_time_max:
+                        self.handler_time_max = elapsed
+                finally:
+                    tasks.task_done()
+        finally:
+            # Handlers use the DB; hand this thread's pooled connection back when the worker exits
+            close_db()
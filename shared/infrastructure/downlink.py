@@ -0,0 +1,78 @@
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from shared.infrastructure.wire import BINARY, encode_reservation
+
+DEVICE = "device"
+BROADCAST = "broadcast"
+BOTH = "both"
+
+
+class DeviceDownlink:
+    """Sends reservation changes to the sensors.
+
+    ``broadcast`` (the default) keeps the single shared topic that every
+    sensor subscribes to, which is all firmware from before per-device topics
+    understands. ``both`` also publishes on the per-device topic while a fleet
+    is being upgraded, and ``device`` sends each change only to the sensor of
+    that spot, on ``<prefix>/<mac>``, in the wire format the device negotiated
+    at provisioning (JSON or a binary frame); the MAC and format come from the
+    spot returned by ``device_lookup``. In ``device`` mode, spots without a
+    known MAC fall back to the broadcast topic, in JSON.
+    """
+
+    def __init__(self, client, broadcast_topic: Optional[str], device_prefix: Optional[str] = None,
+                 mode: str = BROADCAST, device_lookup: Optional[Callable[[str], Optional[object]]] = None,
+                 qos: int = 1):
+        if mode not in (DEVICE, BROADCAST, BOTH):
+            raise ValueError(f"Unknown downlink mode: {mode}")
+        if mode != BROADCAST and device_lookup is None:
+            raise ValueError("Per-device topics need a device lookup")
+
+        self.client = client
+        self.broadcast_topic = broadcast_topic
+        self.device_prefix = (device_prefix or broadcast_topic or "").rstrip("/")
+        self.mode = mode
+        self.device_lookup = device_lookup
+        self.qos = qos
+
+    @property
+    def per_device(self) -> bool:
+        return self.mode in (DEVICE, BOTH)
+
+    def topic_for(self, mac_address: str) -> str:
+        return f"{self.device_prefix}/{mac_address.lower()}"
+
+    def send_reservation(self, spot_id: str, api_key: str, reserved: bool) -> bool:
+        return self.send_reservations([(spot_id, reserved)], api_key)
+
+    def send_reservations(self, changes: Iterable[Tuple[str, bool]], api_key: str = '') -> bool:
+        """Notify the sensors of ``(spot_id, reserved)`` changes. Returns True if every publish succeeded."""
+        changes = list(changes)
+        broadcast: List[Tuple[str, bool]] = changes if self.mode != DEVICE else []
+        ok = True
+
+        if self.per_device:
+            for spot_id, reserved in changes:
+                spot = self.device_lookup(spot_id)
+                if not spot or not spot.mac_address:
+                    if self.mode == DEVICE:
+                        broadcast.append((spot_id, reserved))
+                    continue
+                if spot.wire_format == BINARY and spot.handle is not None:
+                    payload = encode_reservation(spot.handle, reserved)
+                else:
+                    payload = {'spotId': spot_id, 'apiKey': api_key, 'reserved': reserved}
+                ok = self.client.publish(self.topic_for(spot.mac_address), payload, qos=self.qos,
+                                         metric_topic=f"{self.device_prefix}/+") and ok
+
+        if broadcast and self.broadcast_topic:
+            ok = self._broadcast(broadcast, api_key) and ok
+        return ok
+
+    def _broadcast(self, changes: List[Tuple[str, bool]], api_key: str) -> bool:
+        # One message per spot, in the only shape firmware on the shared topic understands
+        ok = True
+        for spot_id, reserved in changes:
+            payload = {'spotId': spot_id, 'apiKey': api_key, 'reserved': reserved}
+            ok = self.client.publish(self.broadcast_topic, payload, qos=self.qos) and ok
+        return ok
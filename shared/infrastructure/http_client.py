@@ -0,0 +1,100 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+load_dotenv()
+
+RETRY_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class HttpClient:
+    """Shared HTTP client for the central API.
+
+    Keeps a pooled keep-alive session, applies connect/read timeouts to every
+    request and retries idempotent requests on connection errors, timeouts and
+    429/502/503/504 responses with exponential backoff and full jitter.
+    """
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 3.0, read_timeout: float = 10.0,
+                 retries: int = 3, backoff: float = 0.3, backoff_max: float = 5.0):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, url: str, retry: Optional[bool] = None, **kwargs) -> requests.Response:
+        """Send a request. ``retry`` defaults to True for idempotent methods only."""
+        method = method.upper()
+        if retry is None:
+            retry = method in RETRY_METHODS
+        kwargs.setdefault("timeout", self.timeout)
+
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    return response
+                response.close()
+
+            time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt))))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def fan_out(self, func: Callable[[Any], Any], items: Iterable[Any],
+                max_concurrency: Optional[int] = None) -> List[Any]:
+        """Call ``func`` for every item with at most ``max_concurrency`` calls in flight.
+
+        Results come back in the order of ``items``; an exception raised by
+        ``func`` is returned in place of its result.
+        """
+        items = list(items)
+        if not items:
+            return []
+        workers = min(max_concurrency or self.pool_size, self.pool_size, len(items))
+
+        def call(item):
+            try:
+                return func(item)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http-fan-out") as executor:
+            return list(executor.map(call, items))
+
+    def close(self):
+        self.session.close()
+
+
+http_client = HttpClient(
+    pool_size=int(os.getenv("HTTP_POOL_SIZE", "10")),
+    connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "3")),
+    read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "10")),
+    retries=int(os.getenv("HTTP_RETRIES", "3")),
+    backoff=float(os.getenv("HTTP_BACKOFF", "0.3"))
+)
@@ -0,0 +1,36 @@
+from dataclasses import fields
+from typing import Any, Dict, Generic, Iterable, List, Tuple, Type, TypeVar
+
+from peewee import Model
+
+E = TypeVar('E')
+
+
+class RowMapper(Generic[E]):
+    """Maps between a peewee model and a domain entity whose fields share the same names.
+
+    Queries built with :meth:`select` return plain tuples in the entity's field
+    order, so rows become entities without instantiating any peewee model.
+    """
+
+    def __init__(self, model: Type[Model], entity: Type[E]):
+        self.model = model
+        self.entity = entity
+        self.field_names: Tuple[str, ...] = tuple(field.name for field in fields(entity))
+        self.columns = tuple(getattr(model, name) for name in self.field_names)
+
+    def select(self):
+        return self.model.select(*self.columns).tuples()
+
+    def from_row(self, row: Tuple) -> E:
+        return self.entity(*row)
+
+    def from_rows(self, rows: Iterable[Tuple]) -> List[E]:
+        entity = self.entity
+        return [entity(*row) for row in rows]
+
+    def from_model(self, model: Model) -> E:
+        return self.entity(*(getattr(model, name) for name in self.field_names))
+
+    def to_dict(self, entity: E) -> Dict[str, Any]:
+        return {name: getattr(entity, name) for name in self.field_names}
@@ -0,0 +1,275 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from threading import get_ident
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; fine enough for sub-millisecond handler stages, wide enough for backend calls
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _CounterChild:
+    # Every thread adds to its own cell, so increments need no lock; reads sum the cells
+    __slots__ = ('_cells',)
+
+    def __init__(self):
+        self._cells: Dict[int, List[float]] = {}
+
+    def inc(self, amount: float = 1.0):
+        cell = self._cells.get(get_ident())
+        if cell is None:
+            cell = self._cells.setdefault(get_ident(), [0.0])
+        cell[0] += amount
+
+    def get(self) -> float:
+        return sum(cell[0] for cell in list(self._cells.values()))
+
+
+class _GaugeChild:
+    __slots__ = ('_value', '_function', '_lock')
+
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from ``function`` at scrape time instead of storing it"""
+        self._function = function
+
+    def get(self) -> float:
+        return float(self._function()) if self._function else self._value
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_started')
+
+    def __init__(self, histogram: '_HistogramChild'):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._histogram.observe(time.perf_counter() - self._started)
+        return False
+
+
+class _HistogramChild:
+    # Per-thread cells as in _CounterChild: one count per bound plus +Inf, then the sum
+    __slots__ = ('_bounds', '_cells')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        self._cells: Dict[int, List[float]] = {}
+
+    def observe(self, value: float):
+        cell = self._cells.get(get_ident())
+        if cell is None:
+            cell = self._cells.setdefault(get_ident(), [0] * (len(self._bounds) + 1) + [0.0])
+        cell[bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def time(self) -> _Timer:
+        """Context manager that observes the seconds spent inside it"""
+        return _Timer(self)
+
+    def get(self) -> Tuple[List[int], float]:
+        """Non-cumulative count per bucket, and the sum of all observations"""
+        counts = [0] * (len(self._bounds) + 1)
+        total = 0.0
+        for cell in list(self._cells.values()):
+            for index in range(len(counts)):
+                counts[index] += cell[index]
+            total += cell[-1]
+        return counts, total
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        # Children keyed by the label values exactly as passed, so lookups skip the str() conversion
+        self._lookup: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """The child for one combination of label values; keep it around on hot paths"""
+        child = self._lookup.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(value) for value in values), self._new_child())
+                self._lookup[values] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {_escape_help(self.documentation)}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+    def _children_items(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def _samples(self):
+        for values, child in self._children_items():
+            yield '_total', dict(zip(self.labelnames, values)), child.get()
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default.set_function(function)
+
+    def _samples(self):
+        for values, child in self._children_items():
+            try:
+                value = child.get()
+            except Exception as e:
+                print(f"Error reading gauge {self.name}: {e}")
+                continue
+            yield '', dict(zip(self.labelnames, values)), value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+    def _samples(self):
+        for values, child in self._children_items():
+            labels = dict(zip(self.labelnames, values))
+            counts, total = child.get()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield '_bucket', {**labels, 'le': _format_value(bound)}, cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, cumulative
+
+
+class MetricsRegistry:
+    """Process-wide set of metrics, rendered in the Prometheus text exposition format.
+
+    ``counter``, ``gauge`` and ``histogram`` return the already registered
+    metric when the name is taken, so several modules can share one metric.
+    """
+
+    def __init__(self, prefix: str = ''):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def _register(self, kind, name, documentation, labelnames, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = kind(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, kind) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels")
+            return metric
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if value != value:
+        return 'NaN'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+registry = MetricsRegistry(prefix='smart_parking_')
+
+# Latency of each step of the message pipeline, labelled by stage
+# (decode, db_read, db_write, cloud_publish, provisioning_lookup, backend_api, ...)
+pipeline_stage_seconds = registry.histogram(
+    'pipeline_stage_seconds', 'Time spent in each stage of the message pipeline', ['stage'])
@@ -0,0 +1,220 @@
+"""
+Versioned schema migrations for the edge database.
+
+The applied version is stored in SQLite's ``user_version`` pragma. Every
+migration runs in its own transaction, so a failed migration leaves the
+database at the previous version.
+"""
+from shared.infrastructure.database import db
+
+
+def _create_base_tables():
+    # Frozen DDL of the schema before migrations existed; later changes belong in their own migration
+    db.execute_sql("""
+        CREATE TABLE IF NOT EXISTS parking_spots (
+            spot_id VARCHAR(255) NOT NULL PRIMARY KEY,
+            spot_label VARCHAR(255) NOT NULL,
+            status VARCHAR(255) NOT NULL,
+            mac_address VARCHAR(255),
+            parking_id INTEGER NOT NULL,
+            edge_id VARCHAR(255) NOT NULL,
+            device_type VARCHAR(255) NOT NULL,
+            last_updated VARCHAR(255) NOT NULL,
+            created_at VARCHAR(255) NOT NULL
+        )""")
+    db.execute_sql("""
+        CREATE TABLE IF NOT EXISTS edge_servers (
+            edge_id VARCHAR(255) NOT NULL PRIMARY KEY,
+            parking_id INTEGER NOT NULL,
+            name VARCHAR(255),
+            api_key VARCHAR(255),
+            status VARCHAR(255) NOT NULL,
+            mac_address VARCHAR(255),
+            last_sync DATETIME NOT NULL,
+            created_at DATETIME NOT NULL
+        )""")
+    db.execute_sql("""
+        CREATE TABLE IF NOT EXISTS cloud_outbox (
+            id INTEGER NOT NULL PRIMARY KEY,
+            topic VARCHAR(255) NOT NULL,
+            payload BLOB NOT NULL,
+            qos INTEGER NOT NULL,
+            retain INTEGER NOT NULL,
+            compaction_key VARCHAR(255),
+            created_at DATETIME NOT NULL
+        )""")
+    db.execute_sql("CREATE INDEX IF NOT EXISTS outboxmessage_compaction_key ON cloud_outbox (compaction_key)")
+
+
+def _parking_spots_typed_timestamps_and_indexes():
+    columns = {row[1]: row[2].upper() for row in db.execute_sql("PRAGMA table_info(parking_spots)")}
+    if columns.get('last_updated') != 'DATETIME' or columns.get('created_at') != 'DATETIME':
+        # SQLite cannot change a column type in place, so rebuild the table
+        db.execute_sql("""
+            CREATE TABLE parking_spots_new (
+                spot_id VARCHAR(255) NOT NULL PRIMARY KEY,
+                spot_label VARCHAR(255) NOT NULL,
+                status VARCHAR(255) NOT NULL,
+                mac_address VARCHAR(255),
+                parking_id INTEGER NOT NULL,
+                edge_id VARCHAR(255) NOT NULL,
+                device_type VARCHAR(255) NOT NULL,
+                last_updated DATETIME NOT NULL,
+                created_at DATETIME NOT NULL
+            )""")
+        db.execute_sql("""
+            INSERT INTO parking_spots_new
+            SELECT spot_id, spot_label, status, mac_address, parking_id, edge_id, device_type,
+                   last_updated, created_at
+            FROM parking_spots""")
+        db.execute_sql("DROP TABLE parking_spots")
+        db.execute_sql("ALTER TABLE parking_spots_new RENAME TO parking_spots")
+
+    # ISO-8601 values ("2025-01-01T10:00:00+00:00") don't sort with peewee's
+    # "YYYY-MM-DD HH:MM:SS.ffffff" format; rewrite them as UTC in that format.
+    for column in ('last_updated', 'created_at'):
+        db.execute_sql(f"""
+            UPDATE parking_spots
+            SET {column} = strftime('%Y-%m-%d %H:%M:%f', {column})
+            WHERE {column} LIKE '%T%' AND strftime('%Y-%m-%d %H:%M:%f', {column}) IS NOT NULL""")
+
+    db.execute_sql("UPDATE parking_spots SET mac_address = lower(mac_address) WHERE mac_address != lower(mac_address)")
+    duplicates = db.execute_sql("""
+        SELECT spot_id, mac_address FROM parking_spots AS p
+        WHERE mac_address IS NOT NULL AND EXISTS (
+            SELECT 1 FROM parking_spots AS o
+            WHERE o.mac_address = p.mac_address
+              AND (o.last_updated > p.last_updated OR (o.last_updated = p.last_updated AND o.rowid > p.rowid))
+        )""").fetchall()
+    for spot_id, mac_address in duplicates:
+        print(f"MAC {mac_address} is assigned to several spots, removing it from spot {spot_id}")
+        db.execute_sql("UPDATE parking_spots SET mac_address = NULL WHERE spot_id = ?", (spot_id,))
+
+    db.execute_sql("CREATE UNIQUE INDEX IF NOT EXISTS parking_spots_mac_address ON parking_spots (lower(mac_address))")
+    db.execute_sql("CREATE INDEX IF NOT EXISTS parking_spots_parking_id_status ON parking_spots (parking_id, status)")
+    db.execute_sql("CREATE INDEX IF NOT EXISTS parking_spots_status ON parking_spots (status)")
+    db.execute_sql("CREATE INDEX IF NOT EXISTS parking_spots_edge_id ON parking_spots (edge_id)")
+
+
+def _spot_transitions_and_rollups():
+    db.execute_sql("""
+        CREATE TABLE IF NOT EXISTS spot_transitions (
+            id INTEGER NOT NULL PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            spot_id VARCHAR(255) NOT NULL,
+            parking_id INTEGER NOT NULL,
+            old_status VARCHAR(255),
+            new_status VARCHAR(255) NOT NULL,
+            source VARCHAR(255)
+        )""")
+    db.execute_sql("CREATE INDEX IF NOT EXISTS spottransition_ts ON spot_transitions (ts)")
+    db.execute_sql("CREATE INDEX IF NOT EXISTS spottransition_parking_id_ts ON spot_transitions (parking_id, ts)")
+    db.execute_sql("""
+        CREATE TABLE IF NOT EXISTS spot_occupancy_rollups (
+            parking_id INTEGER NOT NULL,
+            period INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            transitions INTEGER NOT NULL,
+            occupied INTEGER NOT NULL,
+            vacated INTEGER NOT NULL,
+            reserved INTEGER NOT NULL,
+            PRIMARY KEY (period, parking_id, bucket)
+        )""")
+    db.execute_sql("CREATE INDEX IF NOT EXISTS occupancyrollup_period_bucket ON spot_occupancy_rollups (period, bucket)")
+
+
+def _parking_spots_wire_format():
+    columns = {row[1] for row in db.execute_sql("PRAGMA table_info(parking_spots)")}
+    if 'handle' not in columns:
+        db.execute_sql("ALTER TABLE parking_spots ADD COLUMN handle INTEGER")
+    if 'wire_format' not in columns:
+        db.execute_sql("ALTER TABLE parking_spots ADD COLUMN wire_format VARCHAR(255) NOT NULL DEFAULT 'json'")
+    db.execute_sql("CREATE UNIQUE INDEX IF NOT EXISTS parking_spots_handle ON parking_spots (handle)")
+
+
+def _spot_analytics_checkpoints():
+    db.execute_sql("""
+        CREATE TABLE IF NOT EXISTS spot_analytics_buckets (
+            bucket INTEGER NOT NULL,
+            spot_id VARCHAR(255) NOT NULL,
+            parking_id INTEGER NOT NULL,
+            arrivals REAL NOT NULL,
+            dwell_sum REAL NOT NULL,
+            dwell_count REAL NOT NULL,
+            latency_sum REAL NOT NULL,
+            latency_count REAL NOT NULL,
+            occupied_seconds REAL NOT NULL,
+            PRIMARY KEY (bucket, spot_id)
+        )""")
+    db.execute_sql("""
+        CREATE TABLE IF NOT EXISTS spot_analytics_state (
+            spot_id VARCHAR(255) NOT NULL PRIMARY KEY,
+            parking_id INTEGER NOT NULL,
+            state_code INTEGER NOT NULL,
+            state_since INTEGER NOT NULL
+        )""")
+    db.execute_sql("""
+        CREATE TABLE IF NOT EXISTS spot_analytics_checkpoint (
+            id INTEGER NOT NULL PRIMARY KEY,
+            last_transition_id INTEGER NOT NULL,
+            bucket_seconds INTEGER NOT NULL
+        )""")
+
+
+def _spot_transitions_autoincrement():
+    # Without AUTOINCREMENT SQLite hands out max(id) + 1, so ids come back once pruning empties the
+    # table, and the analytics (which read everything after the last id they saw) would skip them
+    db.execute_sql("""
+        CREATE TABLE spot_transitions_new (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,
+            spot_id VARCHAR(255) NOT NULL,
+            parking_id INTEGER NOT NULL,
+            old_status VARCHAR(255),
+            new_status VARCHAR(255) NOT NULL,
+            source VARCHAR(255)
+        )""")
+    db.execute_sql("""
+        INSERT INTO spot_transitions_new (id, ts, spot_id, parking_id, old_status, new_status, source)
+        SELECT id, ts, spot_id, parking_id, old_status, new_status, source FROM spot_transitions""")
+    db.execute_sql("DROP TABLE spot_transitions")
+    db.execute_sql("ALTER TABLE spot_transitions_new RENAME TO spot_transitions")
+    db.execute_sql("CREATE INDEX IF NOT EXISTS spottransition_ts ON spot_transitions (ts)")
+    db.execute_sql("CREATE INDEX IF NOT EXISTS spottransition_parking_id_ts ON spot_transitions (parking_id, ts)")
+
+    # The table may already have been emptied by pruning: continue after the last id the analytics saw
+    db.execute_sql("DELETE FROM sqlite_sequence WHERE name = 'spot_transitions'")
+    db.execute_sql("""
+        INSERT INTO sqlite_sequence (name, seq) SELECT 'spot_transitions', max(
+            (SELECT coalesce(max(id), 0) FROM spot_transitions),
+            (SELECT coalesce(max(last_transition_id), 0) FROM spot_analytics_checkpoint))""")
+
+
+# (version, migration) pairs, in order. Never edit an applied migration; add a new one.
+MIGRATIONS = [
+    (1, _create_base_tables),
+    (2, _parking_spots_typed_timestamps_and_indexes),
+    (3, _spot_transitions_and_rollups),
+    (4, _parking_spots_wire_format),
+    (5, _spot_analytics_checkpoints),
+    (6, _spot_transitions_autoincrement),
+]
+
+
+def get_schema_version() -> int:
+    return db.execute_sql("PRAGMA user_version").fetchone()[0]
+
+
+def migrate() -> int:
+    """Apply every pending migration and return the resulting schema version"""
+    with db.connection_context():
+        current = get_schema_version()
+        for version, migration in MIGRATIONS:
+            if version <= current:
+                continue
+            print(f"Applying database migration {version}: {migration.__name__.strip('_')}")
+            with db.atomic():
+                migration()
+                db.execute_sql(f"PRAGMA user_version = {version}")
+            current = version
+        return current
@@ -3,21 +3,52 @@ import time
 import threading
 
 import paho.mqtt.client as mqtt
-import json
 import logging
 from typing import Optional, Callable, Dict, Any
 from dotenv import load_dotenv
 
 from device.application.services import DeviceService
+from device.domain.services import OccupancyFilter
 from iam.application.services import AuthApplicationService
 from parking_spot.application.services import ParkingSpotApplicationService
+from parking_spot.infrastructure.repositories import spot_cache
+from shared.infrastructure.codec import DecodeError, JsonCodec, json_codec
+from shared.infrastructure.dispatcher import KeyedWorkerPool, BLOCK
+from shared.infrastructure.downlink import DeviceDownlink, BROADCAST
+from shared.infrastructure.metrics import registry, pipeline_stage_seconds
+from shared.infrastructure.outbox import Outbox
+from shared.infrastructure.topic_trie import TopicTrie
+from shared.infrastructure.uplink import CloudUplink, PER_MESSAGE
+from shared.infrastructure.wire import BINARY, JSON, BinaryFrame, WireCodec
 
 load_dotenv()
 
+_messages_received = registry.counter('mqtt_messages_received', 'MQTT messages received', ['client', 'topic'])
+_messages_published = registry.counter('mqtt_messages_published', 'MQTT messages handed to the broker',
+                                       ['client', 'topic'])
+_messages_outboxed = registry.counter('mqtt_messages_outboxed', 'MQTT messages stored in the outbox', ['client'])
+_decode_failures = registry.counter('mqtt_decode_failures', 'MQTT messages whose payload could not be decoded',
+                                    ['client'])
+_publish_failures = registry.counter('mqtt_publish_failures', 'MQTT messages that could not be published',
+                                     ['client'])
+_handler_seconds = registry.histogram('mqtt_handler_seconds', 'Time spent in subscription callbacks',
+                                      ['client', 'subscription'])
+_queue_wait_seconds = registry.histogram('mqtt_queue_wait_seconds', 'Time messages wait for a worker', ['client'])
+_connected = registry.gauge('mqtt_connected', '1 while connected to the broker', ['client'])
+_pending_subscriptions = registry.gauge('mqtt_pending_subscriptions', 'Subscriptions waiting for a connection',
+                                        ['client'])
+_outgoing_queue = registry.gauge('mqtt_outgoing_queue', 'Messages queued in paho waiting to be sent or acknowledged',
+                                 ['client'])
+_occupancy_readings = registry.counter('occupancy_filter_readings',
+                                       'Sensor readings forwarded or suppressed by the occupancy filter', ['result'])
+_worker_queue = registry.gauge('mqtt_worker_queue', 'Messages waiting for a worker', ['client'])
+
 
 class MQTTClient:
     def __init__(self, client_id: str, host: str = "localhost", port: int = 1883,
-                 username: Optional[str] = None, password: Optional[str] = None):
+                 username: Optional[str] = None, password: Optional[str] = None,
+                 workers: int = 0, queue_size: int = 1000, drop_policy: str = BLOCK,
+                 outbox: Optional[Outbox] = None, name: Optional[str] = None, codec: JsonCodec = json_codec):
         """
         Args:
             client_id: Identificador único del cliente
@@ -25,8 +56,15 @@ class MQTTClient:
             port: Puerto del broker MQTT
             username: Usuario para autenticación (opcional)
             password: Contraseña para autenticación (opcional)
+            workers: Hilos que ejecutan los callbacks (0 los ejecuta en el hilo de red de paho)
+            queue_size: Mensajes que pueden esperar en la cola de los workers
+            drop_policy: Qué hacer con la cola llena: 'block', 'drop_newest' o 'drop_oldest'
+            outbox: Almacén persistente para los mensajes que no se pueden publicar (opcional)
+            name: Nombre del cliente en las métricas (por defecto, el client_id)
+            codec: Decodifica los payloads recibidos y codifica los que se publican
         """
         self.client_id = client_id
+        self.name = name or client_id
         self.host = host
         self.port = port
         self.username = username
@@ -39,15 +77,34 @@ class MQTTClient:
         self.client.on_message = self._on_message
 
         self.topic_callbacks: Dict[str, Callable] = {}
+        self._router = TopicTrie()
+
+        self.executor: Optional[KeyedWorkerPool] = None
+        if workers > 0:
+            self.executor = KeyedWorkerPool(workers=workers, queue_size=queue_size,
+                                            drop_policy=drop_policy, name=f"{client_id}-worker")
 
         self.pending_subscriptions: list = []
 
+        self.outbox = outbox
+        self.codec = codec
+
         self.is_connected = False
         self.connection_event = threading.Event()
+        self._accepting = True
 
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
 
+        _connected.labels(self.name).set_function(lambda: self.is_connected)
+        _pending_subscriptions.labels(self.name).set_function(lambda: len(self.pending_subscriptions))
+        # paho keeps unsent and unacknowledged messages in _out_messages
+        _outgoing_queue.labels(self.name).set_function(lambda: len(getattr(self.client, '_out_messages', ())))
+        if self.executor:
+            _worker_queue.labels(self.name).set_function(self.executor.queue_depth)
+        self._queue_wait = _queue_wait_seconds.labels(self.name)
+        self._decode_seconds = pipeline_stage_seconds.labels('decode')
+
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.is_connected = True
@@ -55,6 +112,9 @@ class MQTTClient:
             self.logger.info(f"Conectado al broker MQTT en {self.host}:{self.port}")
 
             self._process_pending_subscriptions()
+
+            if self.outbox:
+                self.outbox.start_replay(self)
         else:
             self.is_connected = False
             self.connection_event.clear()
@@ -69,49 +129,58 @@ class MQTTClient:
             self.logger.info("Desconectado del broker MQTT")
 
     def _on_message(self, client, userdata, msg):
+        received_at = time.perf_counter()
         topic = msg.topic
-        payload = msg.payload.decode('utf-8')
-
-        self.logger.info(f"Mensaje recibido en '{topic}': {payload}")
-
-        if topic in self.topic_callbacks:
-            try:
-                self.topic_callbacks[topic](topic, payload)
-            except Exception as e:
-                self.logger.error(f"Error ejecutando callback para topic '{topic}': {e}")
-
-        for registered_topic, callback in self.topic_callbacks.items():
-            if self._topic_matches(registered_topic, topic):
+        if not self._accepting:
+            self.logger.warning(f"Mensaje en '{topic}' descartado: el cliente se está deteniendo")
+            return
+        _messages_received.labels(self.name, topic).inc()
+        self.logger.debug("Mensaje recibido en '%s': %r", topic, msg.payload)
+
+        subscriptions = self._router.match(topic)
+        if not subscriptions:
+            return
+        try:
+            # Decoded once here; every matching callback gets the same object
+            data = self.codec.decode(msg.payload)
+        except DecodeError as e:
+            _decode_failures.labels(self.name).inc()
+            self.logger.warning(f"Payload inválido en '{topic}': {e}")
+            return
+        self._decode_seconds.observe(time.perf_counter() - received_at)
+
+        for registered_topic, (callback, key) in subscriptions:
+            if self.executor:
+                # An exception here would end paho's network loop, so a bad message only costs itself
                 try:
-                    callback(topic, payload)
+                    # Messages with the same key are handled by the same worker, in order
+                    message_key = key(topic, data) if key else topic
+                    self.executor.submit(message_key, self._dispatch, registered_topic, callback, topic, data,
+                                         received_at)
                 except Exception as e:
-                    self.logger.error(f"Error ejecutando callback para pattern '{registered_topic}': {e}")
-
-    def _topic_matches(self, pattern: str, topic: str) -> bool:
-        if pattern == topic:
-            return False
-
-        pattern_parts = pattern.split('/')
-        topic_parts = topic.split('/')
-
-        if len(pattern_parts) != len(topic_parts):
-            if '+' not in pattern and '#' not in pattern:
-                return False
-
-        for i, pattern_part in enumerate(pattern_parts):
-            if pattern_part == '#':
-                return True
-            if i >= len(topic_parts):
-                return False
-            if pattern_part != '+' and pattern_part != topic_parts[i]:
-                return False
+                    self.logger.error(f"Error encolando mensaje de '{topic}': {e}")
+            else:
+                self._dispatch(registered_topic, callback, topic, data)
 
-        return True
+    def _dispatch(self, registered_topic: str, callback: Callable, topic: str, data: Any,
+                  received_at: Optional[float] = None):
+        started = time.perf_counter()
+        if received_at is not None:
+            self._queue_wait.observe(started - received_at)
+        try:
+            callback(topic, data)
+        except Exception as e:
+            if registered_topic == topic:
+                self.logger.error(f"Error ejecutando callback para topic '{topic}': {e}")
+            else:
+                self.logger.error(f"Error ejecutando callback para pattern '{registered_topic}': {e}")
+        finally:
+            _handler_seconds.labels(self.name, registered_topic).observe(time.perf_counter() - started)
 
     def _process_pending_subscriptions(self):
         for subscription in self.pending_subscriptions:
-            topic, qos, callback = subscription
-            self._do_subscribe(topic, qos, callback)
+            topic, qos, callback, key = subscription
+            self._do_subscribe(topic, qos, callback, key)
         self.pending_subscriptions.clear()
 
     def connect(self, timeout: int = 10) -> bool:
@@ -152,61 +221,126 @@ class MQTTClient:
         """
         return self.connection_event.wait(timeout)
 
-    def disconnect(self):
+    def drain(self, timeout: float = 5.0):
+        """
+        Deja de recibir mensajes y espera a que terminen los que ya están en cola.
+        Los callbacks aún pueden publicar: la conexión sigue abierta.
+        Args:
+            timeout: Tiempo máximo de espera para los workers
+        """
+        if not self._accepting:
+            return
+        if self.is_connected and self.topic_callbacks:
+            self.client.unsubscribe(list(self.topic_callbacks))
+        self._accepting = False
+        if self.executor:
+            self.executor.stop(drain=True, timeout=timeout)
+
+    def wait_for_publishes(self, timeout: float = 5.0) -> bool:
+        """
+        Args:
+            timeout: Tiempo máximo de espera
+        Returns:
+            bool: True si paho envió (y el broker confirmó) todos los mensajes pendientes
+        """
+        deadline = time.monotonic() + timeout
+        while self.is_connected and getattr(self.client, '_out_messages', None):
+            if time.monotonic() >= deadline:
+                self.logger.warning(f"{len(self.client._out_messages)} mensajes sin confirmar al desconectar")
+                return False
+            time.sleep(0.01)
+        return True
+
+    def disconnect(self, timeout: float = 5.0):
+        """
+        Termina los mensajes en curso, envía los pendientes y cierra la conexión.
+        Lo que no se pudo enviar queda en el outbox para la próxima conexión.
+        Args:
+            timeout: Tiempo máximo de espera de cada etapa
+        """
+        self.drain(timeout)
         if self.is_connected:
-            self.client.loop_stop()
+            self.wait_for_publishes(timeout)
             self.client.disconnect()
+        self.client.loop_stop()
+        if self.outbox:
+            self.outbox.stop(timeout)
 
-    def publish(self, topic: str, payload: Any, qos: int = 0, retain: bool = False) -> bool:
+    def publish(self, topic: str, payload: Any, qos: int = 0, retain: bool = False,
+                compaction_key: Optional[str] = None, metric_topic: Optional[str] = None) -> bool:
         """
         Args:
             topic: Topic donde publicar
-            payload: Mensaje a publicar (puede ser string, dict, etc.)
+            payload: Mensaje a publicar: dict/list (se codifica con el codec), str o bytes
             qos: Nivel de calidad de servicio (0, 1, 2)
             retain: Si el mensaje debe ser retenido por el broker
+            compaction_key: Mensajes en el outbox con la misma clave se reemplazan por el más reciente
+            metric_topic: Topic con el que se cuenta el mensaje en las métricas (p. ej. un pattern para
+                los topics por dispositivo, para no crear una serie por dispositivo)
         Returns:
-            bool: True si el mensaje fue publicado exitosamente
+            bool: True si el mensaje fue publicado (o guardado en el outbox) exitosamente
         """
-        if not self.is_connected:
+        if not self.is_connected and not self.outbox:
             self.logger.error("No hay conexión al broker MQTT")
+            _publish_failures.labels(self.name).inc()
             return False
 
         try:
-            if isinstance(payload, dict):
-                payload = json.dumps(payload)
-            elif not isinstance(payload, str):
-                payload = str(payload)
+            payload = self.codec.encode(payload)
+
+            # Keep ordering: while there is a backlog, new messages queue up behind it
+            if self.outbox and (not self.is_connected or self.outbox.has_backlog()):
+                self.outbox.enqueue(topic, payload, qos=qos, retain=retain, compaction_key=compaction_key)
+                _messages_outboxed.labels(self.name).inc()
+                self.logger.debug("Mensaje guardado en el outbox para '%s'", topic)
+                if self.is_connected:
+                    # Makes sure a replay is draining the backlog this message joined
+                    self.outbox.start_replay(self)
+                return True
 
             result = self.client.publish(topic, payload, qos=qos, retain=retain)
 
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                self.logger.info(f"Mensaje publicado en '{topic}': {payload}")
+                _messages_published.labels(self.name, metric_topic or topic).inc()
+                self.logger.debug("Mensaje publicado en '%s': %r", topic, payload)
+                return True
+            elif self.outbox:
+                self.outbox.enqueue(topic, payload, qos=qos, retain=retain, compaction_key=compaction_key)
+                _messages_outboxed.labels(self.name).inc()
+                self.logger.warning(f"Error publicando mensaje en '{topic}', guardado en el outbox")
+                if self.is_connected:
+                    self.outbox.start_replay(self)
                 return True
             else:
                 self.logger.error(f"Error publicando mensaje en '{topic}'")
+                _publish_failures.labels(self.name).inc()
                 return False
 
         except Exception as e:
             self.logger.error(f"Error publicando mensaje: {e}")
+            _publish_failures.labels(self.name).inc()
             return False
 
-    def subscribe(self, topic: str, qos: int = 0, callback: Optional[Callable] = None) -> bool:
+    def subscribe(self, topic: str, qos: int = 0, callback: Optional[Callable[[str, Any], None]] = None,
+                  key: Optional[Callable[[str, Any], Any]] = None) -> bool:
         """
         Args:
             topic: Topic al que suscribirse
             qos: Nivel de calidad de servicio
-            callback: Función callback personalizada para este topic
+            callback: Función (topic, payload decodificado) que procesa los mensajes de este topic
+            key: Función (topic, payload decodificado) que agrupa los mensajes que deben procesarse en orden
         Returns:
             bool: True si la suscripción fue exitosa
         """
         if not self.is_connected:
             self.logger.info(f"Agregando suscripción pendiente para '{topic}'")
-            self.pending_subscriptions.append((topic, qos, callback))
+            self.pending_subscriptions.append((topic, qos, callback, key))
             return True
 
-        return self._do_subscribe(topic, qos, callback)
+        return self._do_subscribe(topic, qos, callback, key)
 
-    def _do_subscribe(self, topic: str, qos: int = 0, callback: Optional[Callable] = None) -> bool:
+    def _do_subscribe(self, topic: str, qos: int = 0, callback: Optional[Callable[[str, Any], None]] = None,
+                      key: Optional[Callable[[str, Any], Any]] = None) -> bool:
         try:
             result = self.client.subscribe(topic, qos=qos)
 
@@ -215,6 +349,7 @@ class MQTTClient:
 
                 if callback:
                     self.topic_callbacks[topic] = callback
+                    self._router.insert(topic, (callback, key))
 
                 return True
             else:
@@ -245,6 +380,7 @@ class MQTTClient:
                 # Remover callback personalizado si existe
                 if topic in self.topic_callbacks:
                     del self.topic_callbacks[topic]
+                    self._router.remove(topic)
 
                 return True
             else:
@@ -256,12 +392,24 @@ class MQTTClient:
             return False
 
 
+device_service = DeviceService()
+# Binary frames are unauthenticated (see shared.infrastructure.wire), so devices only get them when enabled here
+binary_frames_enabled = os.getenv("MQTT_DEVICE_BINARY_FRAMES", "false").lower() == "true"
+
 mqtt_client_device = MQTTClient(
     client_id=f"flask_client_{int(time.time())}",
     host=os.getenv("MQTT_DEVICE_BROKER", "localhost"),
     port=int(os.getenv("MQTT_DEVICE_PORT")),
     username=os.getenv("MQTT_DEVICE_USERNAME"),
-    password=os.getenv("MQTT_DEVICE_PASSWORD")
+    password=os.getenv("MQTT_DEVICE_PASSWORD"),
+    workers=int(os.getenv("MQTT_DEVICE_WORKERS", "4")),
+    queue_size=int(os.getenv("MQTT_DEVICE_QUEUE_SIZE", "1000")),
+    drop_policy=os.getenv("MQTT_DEVICE_DROP_POLICY", BLOCK),
+    name="device",
+    # Devices that negotiated it at provisioning send compact binary frames instead of JSON. Handles are
+    # looked up straight in the cache, which is warmed before MQTT connects and indexes new handles as
+    # they are assigned
+    codec=WireCodec(resolve_handle=spot_cache.spot_id_for_handle) if binary_frames_enabled else json_codec
 )
 
 mqtt_client_cloud = MQTTClient(
@@ -269,64 +417,122 @@ mqtt_client_cloud = MQTTClient(
     host=os.getenv("MQTT_CLOUD_BROKER", "localhost"),
     port=int(os.getenv("MQTT_CLOUD_PORT")),
     username=os.getenv("MQTT_CLOUD_USERNAME"),
-    password=os.getenv("MQTT_CLOUD_PASSWORD")
+    password=os.getenv("MQTT_CLOUD_PASSWORD"),
+    workers=int(os.getenv("MQTT_CLOUD_WORKERS", "2")),
+    queue_size=int(os.getenv("MQTT_CLOUD_QUEUE_SIZE", "1000")),
+    drop_policy=os.getenv("MQTT_CLOUD_DROP_POLICY", BLOCK),
+    outbox=Outbox(
+        max_messages=int(os.getenv("MQTT_CLOUD_OUTBOX_MAX_MESSAGES", "50000")),
+        replay_rate=int(os.getenv("MQTT_CLOUD_OUTBOX_REPLAY_RATE", "200"))
+    ),
+    name="cloud"
 )
 
-device_service = DeviceService()
 edge_service = AuthApplicationService()
 parking_service = ParkingSpotApplicationService()
+occupancy_filter = OccupancyFilter(
+    debounce_ms=int(os.getenv("OCCUPANCY_DEBOUNCE_MS", "0")),
+    debounce_samples=int(os.getenv("OCCUPANCY_DEBOUNCE_SAMPLES", "1"))
+)
+
+cloud_uplink = CloudUplink(
+    mqtt_client_cloud,
+    mode=os.getenv("MQTT_CLOUD_UPLINK_MODE", PER_MESSAGE),
+    window_ms=int(os.getenv("MQTT_CLOUD_UPLINK_WINDOW_MS", "1000")),
+    snapshot_provider=parking_service.get_spot_statuses
+)
+
+device_downlink = DeviceDownlink(
+    mqtt_client_device,
+    broadcast_topic=os.getenv("MQTT_DEVICE_TOPIC_RESERVA"),
+    device_prefix=os.getenv("MQTT_DEVICE_TOPIC_RESERVA_PREFIX"),
+    # Deployed firmware only listens on the shared topic; "both" or "device" once the fleet is upgraded
+    mode=os.getenv("MQTT_DEVICE_DOWNLINK_MODE", BROADCAST),
+    device_lookup=device_service.get_device
+)
 
 status_topic = os.getenv("MQTT_CLOUD_TOPIC_PARKING")
-def on_device_status_update(topic: str, payload: str):
+
+_state_update_seconds = pipeline_stage_seconds.labels('state_update')
+_cloud_publish_seconds = pipeline_stage_seconds.labels('cloud_publish')
+_device_publish_seconds = pipeline_stage_seconds.labels('device_publish')
+_provisioning_lookup_seconds = pipeline_stage_seconds.labels('provisioning_lookup')
+_provisioning_upsert_seconds = pipeline_stage_seconds.labels('provisioning_upsert')
+
+def spot_key(topic: str, data: Any):
+    """Ordering key for worker dispatch: the message's spotId, or the topic if it has none"""
+    spot_id = data.get("spotId") if isinstance(data, dict) else None
+    # Payloads are untrusted: a list or object spotId would not be hashable
+    return str(spot_id) if spot_id is not None else topic
+
+
+def on_device_status_update(topic: str, data: Dict[str, Any]):
     try:
-        data = json.loads(payload)
         spot_id = data.get("spotId")
         api_key = data.get("apiKey")
         occupied = data.get("occupied")
-        if spot_id is not None and occupied is not None and api_key is not None:
-            edge = edge_service.get_edge_server()
+        binary = isinstance(data, BinaryFrame)
+        if spot_id is not None and occupied is not None and (api_key is not None or binary):
+            spot = device_service.get_device(spot_id)
+            if spot is None:
+                # Checked before the filter, so unknown ids never get filter state
+                print(f"Status update for unknown spot {spot_id}; ignored")
+                return
+            if binary and spot.wire_format != BINARY:
+                print(f"Binary frame for spot {spot_id}, whose device did not negotiate binary; ignored")
+                return
             status = "OCCUPIED" if occupied else "AVAILABLE"
-            device_service.update_device_status(spot_id, status)
-
-            mqtt_client_cloud.publish(status_topic + edge.edge_id, json.dumps({
-                'spotId': spot_id,
-                'apiKey': api_key,
-                'occupied': occupied
-            }), qos=1)
+            if not occupancy_filter.accept(spot_id, status, spot.status):
+                # Unchanged or not yet stable: nothing to write or forward
+                _occupancy_readings.labels('suppressed').inc()
+                return
+            _occupancy_readings.labels('forwarded').inc()
+
+            identity = edge_service.get_edge_identity()
+            if api_key is None:
+                # Binary frames leave the API key out; it is the edge's own, handed out at provisioning
+                api_key = identity.edge.api_key
+            with _state_update_seconds.time():
+                device_service.update_device_status(spot_id, status, source='sensor')
+
+            with _cloud_publish_seconds.time():
+                cloud_uplink.send_status(identity.status_topic, spot_id, api_key, occupied)
 
             print(f"Device status updated: spot_id={spot_id}, status={status}")
         else:
             print(f"Invalid data received: {data}")
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON: {e}")
     except Exception as e:
         print(f"Error processing device status update: {e}")
 
 
-def on_device_provisioning_request(topic: str, payload: str):
+def on_device_provisioning_request(topic: str, data: Dict[str, Any]):
     try:
         print("Received provisioning request on topic:", topic)
-        data = json.loads(payload)
         mac = data.get("mac")
         if mac:
             mac = mac.lower()
-            response = device_service.provision_device(mac)
+            with _provisioning_lookup_seconds.time():
+                encoding = data.get("encoding")
+                if encoding == BINARY and not binary_frames_enabled:
+                    encoding = JSON
+                response = device_service.provision_device(mac, encoding)
             if response:
+                if device_downlink.per_device:
+                    # Tell the sensor where its reservation changes will arrive
+                    response["reservationTopic"] = device_downlink.topic_for(mac)
                 print("Provisioning response:", response)
-                mqtt_client_device.publish("provisioning/response", json.dumps(response), qos=1)
+                with _device_publish_seconds.time():
+                    mqtt_client_device.publish("provisioning/response", response, qos=1)
             else:
                 print("No response from provisioning service")
         else:
             print("No MAC address in provisioning request")
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON in provisioning request: {e}")
     except Exception as e:
         print(f"Error processing provisioning request: {e}")
 
 
-def on_cloud_provisioning_response(topic: str, payload: str):
+def on_cloud_provisioning_response(topic: str, data: Dict[str, Any]):
     try:
-        data = json.loads(payload)
         msg_type = data.get("type")
         if msg_type == "config":
             parking_id = data.get("parkingId")
@@ -337,7 +543,8 @@ def on_cloud_provisioning_response(topic: str, payload: str):
             if parking_id and api_key and server_id and edge_name:
                 print(f"Received provisioning response for parkingId={parking_id}, serverId={server_id}")
                 edge_service.get_or_create_test_edge_server(parking_id, edge_name, api_key, server_id)
-                status_subscribe = mqtt_client_cloud.subscribe(status_topic + server_id, callback=on_cloud_status_update)
+                status_subscribe = mqtt_client_cloud.subscribe(status_topic + server_id, callback=on_cloud_status_update,
+                                                               key=spot_key)
                 print(f"Subscribed to cloud status updates for serverId={server_id}: {status_subscribe}")
             else:
                 print("Invalid data in cloud provisioning response:", data)
@@ -345,34 +552,26 @@ def on_cloud_provisioning_response(topic: str, payload: str):
             devices = data.get("devices", [])
             if devices:
                 print(f"Received {len(devices)} devices in cloud provisioning response")
-                for device in devices:
-                    print("Processing device:", device)
-                    parking_service.create_parking_spot(device.get("macAddress"),device.get("deviceType"),
-                                                device.get("status"), device.get("spotLabel"),
-                                                device.get("spotId"), device.get("parkingId"), device.get("edgeId"))
-
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON in cloud provisioning response: {e}")
+                with _provisioning_upsert_seconds.time():
+                    saved, failures = parking_service.create_parking_spots(devices)
+                print(f"Provisioned {len(saved)} parking spots")
+                for failure in failures:
+                    print(f"Failed to provision spot {failure['spotId']}: {failure['error']}")
+
     except Exception as e:
         print(f"Error processing cloud provisioning response: {e}")
 
-def on_cloud_status_update(topic: str, payload: str):
+def on_cloud_status_update(topic: str, data: Dict[str, Any]):
     try:
         print("Received cloud status update on topic:", topic)
-        data = json.loads(payload)
         if "reserved" in data:
             reserved = data["reserved"]
             spot_id = data["spotId"]
             api_key = data["apiKey"]
 
-            payload = {
-                'spotId': spot_id,
-                'apiKey': api_key,
-                'reserved': reserved
-            }
-            device_service.update_device_status(spot_id, 'RESERVED' if reserved else 'AVAILABLE')
-            mqtt_client_device.publish(os.getenv("MQTT_DEVICE_TOPIC_RESERVA"), json.dumps(payload), qos=1)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON in cloud status update: {e}")
+            with _state_update_seconds.time():
+                device_service.update_device_status(spot_id, 'RESERVED' if reserved else 'AVAILABLE', source='cloud')
+            with _device_publish_seconds.time():
+                device_downlink.send_reservation(spot_id, api_key, reserved)
     except Exception as e:
         print(f"Error processing cloud status update: {e}")
\ No newline at end of file
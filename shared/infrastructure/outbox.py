@@ -0,0 +1,202 @@
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Union
+
+from peewee import Model, AutoField, CharField, BlobField, IntegerField, BooleanField, DateTimeField, fn
+
+from shared.infrastructure.database import db
+
+
+class OutboxMessage(Model):
+    id = AutoField()
+    topic = CharField()
+    payload = BlobField()
+    qos = IntegerField(default=1)
+    retain = BooleanField(default=False)
+    compaction_key = CharField(null=True, index=True)
+    created_at = DateTimeField(default=datetime.now)
+
+    class Meta:
+        database = db
+        table_name = 'cloud_outbox'
+
+
+class Outbox:
+    """Durable store-and-forward queue for messages that could not be published.
+
+    Messages are kept in the ``cloud_outbox`` table in the order they were
+    queued. Before a replay, messages sharing a ``compaction_key`` (e.g. the
+    status of one spot) are collapsed to the newest one. Replay publishes in
+    id order at no more than ``replay_rate`` messages per second and deletes
+    each batch once the broker has acknowledged it. It keeps going for as long
+    as the client is connected and the outbox is not empty; a failed publish or
+    a missing ack is retried after an exponential backoff (``retry_delay`` up
+    to ``max_retry_delay`` seconds). Once more than ``max_messages`` are queued
+    the oldest ones are discarded.
+    """
+
+    def __init__(self, max_messages: int = 50000, replay_rate: int = 200, batch_size: int = 100,
+                 ack_timeout: float = 10.0, retry_delay: float = 0.5, max_retry_delay: float = 30.0):
+        self.max_messages = max_messages
+        self.replay_rate = replay_rate
+        self.batch_size = batch_size
+        self.ack_timeout = ack_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self._pending: Optional[int] = None
+        self._lock = threading.Lock()
+        self._replaying = False
+        self._stopped = threading.Event()
+        self._replay_thread: Optional[threading.Thread] = None
+
+    def has_backlog(self) -> bool:
+        return self._count() > 0
+
+    def enqueue(self, topic: str, payload: Union[str, bytes], qos: int = 1, retain: bool = False,
+                compaction_key: Optional[str] = None):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+
+        with self._lock:
+            pending = self._count_locked()
+            OutboxMessage.create(topic=topic, payload=payload, qos=qos, retain=retain,
+                                 compaction_key=compaction_key)
+            self._pending = pending + 1
+            if self._pending > self.max_messages:
+                self._enforce_retention()
+
+    def compact(self) -> int:
+        """Drop messages superseded by a newer one with the same compaction key"""
+        with self._lock:
+            return self._compact()
+
+    def start_replay(self, client):
+        """Replay the backlog through ``client`` on a background thread, unless a replay is already running"""
+        with self._lock:
+            if self._replaying or self._count_locked() == 0:
+                return
+            self._replaying = True
+            self._stopped.clear()
+            self._replay_thread = threading.Thread(target=self.replay, args=(client,),
+                                                   name="cloud-outbox-replay", daemon=True)
+            self._replay_thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Wait for a running replay to give up; it stops on its own once the client disconnects"""
+        self._stopped.set()
+        thread = self._replay_thread
+        if thread and thread.is_alive():
+            thread.join(timeout)
+
+    def replay(self, client) -> int:
+        """Publish queued messages in order until the outbox is empty or the client disconnects"""
+        try:
+            # A new replay thread starts on every reconnect; its connection must go back to the pool
+            with db.connection_context():
+                replayed = self._replay(client)
+        except BaseException:
+            with self._lock:
+                self._replaying = False
+            raise
+        return replayed
+
+    def _replay(self, client) -> int:
+        self.compact()
+        replayed = 0
+        backoff = 0.0
+        interval = self.batch_size / self.replay_rate if self.replay_rate > 0 else 0
+
+        while client.is_connected and not self._stopped.is_set():
+            started = time.monotonic()
+            batch = list(OutboxMessage
+                         .select(OutboxMessage.id, OutboxMessage.topic, OutboxMessage.payload,
+                                 OutboxMessage.qos, OutboxMessage.retain)
+                         .order_by(OutboxMessage.id)
+                         .limit(self.batch_size)
+                         .tuples())
+            if not batch:
+                with self._lock:
+                    # Recount under the lock: a message enqueued meanwhile is picked up by the next batch,
+                    # and anything enqueued after this starts a new replay
+                    self._pending = None
+                    if self._count_locked() == 0:
+                        self._replaying = False
+                        return replayed
+                continue
+
+            in_flight = []
+            for message_id, topic, payload, qos, retain in batch:
+                info = client.client.publish(topic, bytes(payload), qos=qos, retain=retain)
+                if info.rc != 0:
+                    break
+                in_flight.append((message_id, info))
+
+            acknowledged = []
+            for message_id, info in in_flight:
+                try:
+                    info.wait_for_publish(self.ack_timeout)
+                except (ValueError, RuntimeError):
+                    break
+                if not info.is_published():
+                    break
+                acknowledged.append(message_id)
+
+            if acknowledged:
+                with self._lock:
+                    OutboxMessage.delete().where(OutboxMessage.id.in_(acknowledged)).execute()
+                    self._pending = None
+                replayed += len(acknowledged)
+
+            if len(acknowledged) < len(batch):
+                # Publishing stopped mid-batch; retry the rest (QoS 1 may deliver a message twice)
+                backoff = min(max(backoff * 2, self.retry_delay), self.max_retry_delay)
+                print(f"Cloud outbox replay stalled, retrying in {backoff:.1f}s")
+                self._stopped.wait(backoff)
+                continue
+            backoff = 0.0
+
+            elapsed = time.monotonic() - started
+            if elapsed < interval:
+                time.sleep(interval - elapsed)
+
+        with self._lock:
+            # Disconnected: the next connection starts a new replay
+            self._replaying = False
+        return replayed
+
+    def _count(self) -> int:
+        pending = self._pending
+        if pending is not None:
+            return pending
+        with self._lock:
+            return self._count_locked()
+
+    def _count_locked(self) -> int:
+        if self._pending is None:
+            self._pending = OutboxMessage.select().count()
+        return self._pending
+
+    def _compact(self) -> int:
+        newest = (OutboxMessage
+                  .select(fn.MAX(OutboxMessage.id))
+                  .where(OutboxMessage.compaction_key.is_null(False))
+                  .group_by(OutboxMessage.compaction_key))
+        removed = (OutboxMessage
+                   .delete()
+                   .where(OutboxMessage.compaction_key.is_null(False) & OutboxMessage.id.not_in(newest))
+                   .execute())
+        self._pending = None
+        return removed
+
+    def _enforce_retention(self):
+        # Compact first, then trim to 90% of the limit so we don't do this on every enqueue
+        self._compact()
+        excess = self._count_locked() - int(self.max_messages * 0.9)
+        if excess <= 0:
+            return
+        oldest = OutboxMessage.select(OutboxMessage.id).order_by(OutboxMessage.id).limit(excess)
+        OutboxMessage.delete().where(OutboxMessage.id.in_(oldest)).execute()
+        self._pending = None
+        print(f"Cloud outbox full, discarded {excess} oldest messages")
@@ -0,0 +1,97 @@
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+
+@lru_cache(maxsize=4096)
+def split_topic(topic: str) -> Tuple[str, ...]:
+    """Split a topic or filter into its levels, caching the result for repeated topics"""
+    return tuple(topic.split('/'))
+
+
+class _Node:
+    __slots__ = ('children', 'pattern', 'value')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.pattern: Optional[str] = None
+        self.value: Any = None
+
+
+class TopicTrie:
+    """Maps MQTT topic filters (with ``+`` and ``#`` wildcards) to values.
+
+    Matching walks the trie one topic level at a time, so its cost depends on
+    the depth of the topic rather than on the number of registered filters.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._lock = threading.Lock()
+
+    def insert(self, pattern: str, value: Any):
+        with self._lock:
+            node = self._root
+            for level in split_topic(pattern):
+                child = node.children.get(level)
+                if child is None:
+                    child = _Node()
+                    node.children[level] = child
+                node = child
+            node.pattern = pattern
+            node.value = value
+
+    def remove(self, pattern: str) -> bool:
+        with self._lock:
+            path = [self._root]
+            levels = split_topic(pattern)
+            for level in levels:
+                child = path[-1].children.get(level)
+                if child is None:
+                    return False
+                path.append(child)
+
+            node = path[-1]
+            if node.pattern is None:
+                return False
+            node.pattern = None
+            node.value = None
+
+            # Prune branches that no longer lead to any filter
+            for depth in range(len(levels), 0, -1):
+                node = path[depth]
+                if node.pattern is not None or node.children:
+                    break
+                del path[depth - 1].children[levels[depth - 1]]
+            return True
+
+    def match(self, topic: str) -> List[Tuple[str, Any]]:
+        """Return ``(pattern, value)`` for every filter matching ``topic``"""
+        levels = split_topic(topic)
+        matches: List[Tuple[str, Any]] = []
+        # Wildcards at the first level never match topics starting with '$' (MQTT 3.1.1, 4.7.2)
+        self._match(self._root, levels, 0, not topic.startswith('$'), matches)
+        return matches
+
+    def _match(self, node: _Node, levels: Tuple[str, ...], index: int, wildcards: bool,
+               matches: List[Tuple[str, Any]]):
+        children = node.children
+
+        if wildcards:
+            multi = children.get('#')
+            if multi is not None and multi.pattern is not None:
+                matches.append((multi.pattern, multi.value))
+
+        if index == len(levels):
+            if node.pattern is not None:
+                matches.append((node.pattern, node.value))
+            return
+
+        child = children.get(levels[index])
+        if child is not None:
+            self._match(child, levels, index + 1, True, matches)
+
+        if wildcards:
+            single = children.get('+')
+            if single is not None:
+                self._match(single, levels, index + 1, True, matches)
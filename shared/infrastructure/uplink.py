@@ -0,0 +1,137 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from shared.infrastructure.database import close_db
+
+PER_MESSAGE = "per_message"
+DELTAS = "deltas"
+SNAPSHOT = "snapshot"
+
+
+class CloudUplink:
+    """Forwards spot status changes to the cloud broker.
+
+    In ``per_message`` mode every change is published as soon as it happens.
+    In ``deltas`` and ``snapshot`` mode changes are collected for ``window_ms``
+    and sent as one message per window: either the latest change of every spot
+    that changed, or the status of every spot in the lot. Batched messages carry
+    an ``epoch`` (process start) and a ``seq`` that increases by one per message,
+    so the cloud can detect gaps.
+    """
+
+    def __init__(self, client, mode: str = PER_MESSAGE, window_ms: int = 1000, qos: int = 1,
+                 snapshot_provider: Optional[Callable[[], Dict[str, str]]] = None):
+        if mode not in (PER_MESSAGE, DELTAS, SNAPSHOT):
+            raise ValueError(f"Unknown uplink mode: {mode}")
+        if mode == SNAPSHOT and snapshot_provider is None:
+            raise ValueError("Snapshot mode needs a snapshot provider")
+
+        self.client = client
+        self.mode = mode
+        self.window = window_ms / 1000
+        self.qos = qos
+        self.snapshot_provider = snapshot_provider
+
+        self.epoch = int(time.time() * 1000)
+        self.seq = 0
+
+        self._topic: Optional[str] = None
+        self._api_key: Optional[str] = None
+        self._changes: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        # Held while a window is published, so windows go out one at a time and in seq order
+        self._publish_lock = threading.Lock()
+        self._has_changes = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def send_status(self, topic: str, spot_id: str, api_key: str, occupied: bool) -> bool:
+        if self.mode == PER_MESSAGE:
+            return self.client.publish(topic, {
+                'spotId': spot_id,
+                'apiKey': api_key,
+                'occupied': occupied
+            }, qos=self.qos, compaction_key=f"{topic}|{spot_id}")
+
+        if self._thread is None:
+            self.start()
+
+        if self._topic is not None and topic != self._topic:
+            # The edge identity changed: close the current window on the old topic first
+            self.flush()
+        with self._lock:
+            self._topic = topic
+            self._api_key = api_key
+            self._changes[spot_id] = occupied
+        self._has_changes.set()
+        return True
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="cloud-uplink", daemon=True)
+            self._thread.start()
+
+    def flush(self) -> bool:
+        with self._publish_lock:
+            with self._lock:
+                if not self._changes:
+                    return False
+                changes, self._changes = self._changes, {}
+                topic, api_key = self._topic, self._api_key
+            # Publishing (and building a snapshot) happens outside the lock so send_status never waits on it
+            try:
+                if self._publish_window(topic, api_key, changes):
+                    return True
+            except Exception as e:
+                print(f"Error publishing uplink window: {e}")
+
+            with self._lock:
+                # Put the changes back for the next window; anything newer for the same spot wins
+                changes.update(self._changes)
+                self._changes = changes
+            # Retry on the next window
+            self._has_changes.set()
+            return False
+
+    def stop(self, timeout: float = 5.0):
+        self._stopped.set()
+        self._has_changes.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                self._has_changes.wait()
+                self._stopped.wait(self.window)
+                self._has_changes.clear()
+                self.flush()
+        finally:
+            # The snapshot provider may read the DB; return the pooled connection
+            close_db()
+
+    def _publish_window(self, topic: str, api_key: str, changes: Dict[str, bool]) -> bool:
+        # seq only advances for messages that were handed to the client, so the cloud sees no false gaps
+        seq = self.seq + 1
+        message: Dict[str, Any] = {
+            'type': self.mode,
+            'epoch': self.epoch,
+            'seq': seq,
+            'apiKey': api_key,
+        }
+        if self.mode == DELTAS:
+            message['changes'] = [{'spotId': spot_id, 'occupied': occupied} for spot_id, occupied in changes.items()]
+            published = self.client.publish(topic, message, qos=self.qos)
+        else:
+            # Only the newest snapshot matters if several pile up while offline
+            message['spots'] = self.snapshot_provider()
+            published = self.client.publish(topic, message, qos=self.qos, compaction_key=f"{topic}|snapshot")
+        if published:
+            self.seq = seq
+        return published
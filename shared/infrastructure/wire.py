@@ -0,0 +1,80 @@
+"""
+Compact binary frames for sensor status and reservation messages.
+
+Frames carry no credentials: a spot handle is a small sequential number and
+anyone who can publish on the device broker can forge a frame for any spot
+whose device negotiated binary. Binary mode therefore gives up per-device
+authentication (JSON messages carry the API key, which the cloud checks). It
+is off unless MQTT_DEVICE_BINARY_FRAMES is enabled, and should only be used
+on a device broker that is itself access controlled.
+"""
+import struct
+from typing import Any, Callable, Optional
+
+from shared.infrastructure.codec import DecodeError, JsonCodec
+
+JSON = "json"
+BINARY = "binary"
+WIRE_FORMATS = (JSON, BINARY)
+
+# Frame: magic byte, message type, spot handle (uint16, little endian), flags. 5 bytes in total.
+# 0xB5 can never start a JSON document, so both encodings can share a topic.
+MAGIC = 0xB5
+STATUS = 0x01
+RESERVATION = 0x02
+MAX_HANDLE = 0xFFFF
+
+_FRAME = struct.Struct('<BBHB')
+_FLAG_SET = 0x01
+# Decoded field set by each message type: status frames carry "occupied", reservation frames "reserved"
+_FIELDS = {STATUS: "occupied", RESERVATION: "reserved"}
+
+
+class BinaryFrame(dict):
+    """A decoded binary frame. JSON decoding never produces this type, so whether a message came
+    in as a frame can't be faked from the payload"""
+    __slots__ = ()
+
+
+def encode_status(handle: int, occupied: bool) -> bytes:
+    return _FRAME.pack(MAGIC, STATUS, handle, _FLAG_SET if occupied else 0)
+
+
+def encode_reservation(handle: int, reserved: bool) -> bytes:
+    return _FRAME.pack(MAGIC, RESERVATION, handle, _FLAG_SET if reserved else 0)
+
+
+class WireCodec(JsonCodec):
+    """JSON codec that also understands the compact binary frames sent by
+    devices that negotiated them at provisioning.
+
+    A frame decodes to the same dict its JSON counterpart would, e.g.
+    ``{"spotId": ..., "occupied": True}``, but as a ``BinaryFrame``, with the
+    spot id resolved from the frame's handle through ``resolve_handle``.
+    Frames carry no API key (see the module docstring). Everything else is
+    decoded and encoded as JSON.
+    """
+
+    def __init__(self, resolve_handle: Callable[[int], Optional[str]], use_orjson: bool = True):
+        super().__init__(use_orjson)
+        self.resolve_handle = resolve_handle
+
+    def decode(self, payload) -> Any:
+        # Indexing bytes gives an int, so text payloads never match the magic byte
+        if not payload or payload[0] != MAGIC:
+            return JsonCodec.decode(self, payload)
+        try:
+            _, message_type, handle, flags = _FRAME.unpack(payload)
+        except struct.error as e:
+            raise DecodeError(f"Malformed binary frame: {e}") from e
+        field = _FIELDS.get(message_type)
+        if field is None:
+            raise DecodeError(f"Unknown binary message type {message_type}")
+        spot_id = self.resolve_handle(handle)
+        if spot_id is None:
+            raise DecodeError(f"Unknown spot handle {handle}")
+        # Filled in item by item: calling a dict subclass with keyword arguments costs more than the rest
+        frame = BinaryFrame()
+        frame["spotId"] = spot_id
+        frame[field] = flags & _FLAG_SET != 0
+        return frame
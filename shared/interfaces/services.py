@@ -0,0 +1,11 @@
+from flask import Blueprint, Response
+
+from shared.infrastructure.metrics import registry
+
+metrics_api = Blueprint('metrics_api', __name__)
+
+
+@metrics_api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of every registered metric"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
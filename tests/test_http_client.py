@@ -0,0 +1,146 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+
+from shared.infrastructure.http_client import HttpClient
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers according to the path:
+
+    /flaky/<n>  503 for the first n requests, then 200
+    /down       always 503
+    /slow       200 after ``server.delay`` seconds
+    /item/<x>   200 with body x, after ``server.delay`` seconds; tracks the requests in flight
+    """
+
+    def do_GET(self):
+        self._answer()
+
+    def do_POST(self):
+        self._answer()
+
+    def _answer(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+
+        if self.path.startswith("/flaky/"):
+            self._reply(503 if hits <= int(self.path.rsplit("/", 1)[1]) else 200)
+        elif self.path == "/down":
+            self._reply(503)
+        elif self.path == "/slow":
+            time.sleep(server.delay)
+            self._reply(200)
+        elif self.path.startswith("/item/"):
+            with server.lock:
+                server.in_flight += 1
+                server.peak = max(server.peak, server.in_flight)
+            time.sleep(server.delay)
+            with server.lock:
+                server.in_flight -= 1
+            self._reply(200, self.path.rsplit("/", 1)[1])
+        else:
+            self._reply(404)
+
+    def _reply(self, status: int, body: str = ""):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up before the reply is written; that is expected here
+        pass
+
+
+class HttpClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _StubServer(("127.0.0.1", 0), _StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.hits = {}
+        self.server.delay = 0.05
+        self.server.in_flight = 0
+        self.server.peak = 0
+        threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.client = HttpClient(pool_size=8, connect_timeout=1, read_timeout=1, retries=3, backoff=0.01,
+                                 backoff_max=0.02)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retries_503_until_success(self):
+        response = self.client.get(f"{self.base}/flaky/2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.hits["/flaky/2"], 3)
+
+    def test_returns_last_503_when_retries_run_out(self):
+        response = self.client.get(f"{self.base}/down")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.hits["/down"], 4)
+
+    def test_post_is_not_retried_by_default(self):
+        response = self.client.post(f"{self.base}/down")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.hits["/down"], 1)
+
+    def test_backoff_grows_exponentially_up_to_the_cap(self):
+        client = HttpClient(retries=4, backoff=0.1, backoff_max=0.3)
+        # Full jitter draws from [0, cap]; take the upper bound so the cap itself is visible
+        with mock.patch("shared.infrastructure.http_client.random.uniform", side_effect=lambda low, high: high), \
+                mock.patch("shared.infrastructure.http_client.time.sleep") as sleep:
+            response = client.get(f"{self.base}/down")
+        client.close()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.1, 0.2, 0.3, 0.3])
+
+    def test_read_timeout_is_retried_then_raised(self):
+        self.server.delay = 0.5
+        client = HttpClient(connect_timeout=1, read_timeout=0.1, retries=1, backoff=0.01)
+        started = time.monotonic()
+        with self.assertRaises(requests.exceptions.Timeout):
+            client.get(f"{self.base}/slow")
+        client.close()
+        self.assertEqual(self.server.hits["/slow"], 2)
+        self.assertLess(time.monotonic() - started, 0.5 * 2)
+
+    def test_fan_out_limits_concurrency_and_keeps_order(self):
+        items = [str(n) for n in range(12)]
+
+        def fetch(item):
+            if item == "5":
+                raise ValueError("bad item")
+            return self.client.get(f"{self.base}/item/{item}").text
+
+        results = self.client.fan_out(fetch, items, max_concurrency=3)
+
+        self.assertEqual(results[:5] + results[6:], items[:5] + items[6:])
+        self.assertIsInstance(results[5], ValueError)
+        self.assertEqual(self.server.peak, 3)
+
+    def test_fan_out_never_exceeds_the_pool(self):
+        items = [str(n) for n in range(20)]
+        results = self.client.fan_out(lambda item: self.client.get(f"{self.base}/item/{item}").text, items,
+                                      max_concurrency=50)
+        self.assertEqual(results, items)
+        self.assertLessEqual(self.server.peak, self.client.pool_size)
+
+
+if __name__ == "__main__":
+    unittest.main()